@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger('hemogram_cache')
+
+class CacheEntry:
+    """Resultado em cache com os metadados usados para revalidação HTTP"""
+
+    def __init__(self, value, ttl):
+        self.value = value
+        self.created_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self.expires_at = time.monotonic() + ttl
+        body = json.dumps(value, sort_keys=True, default=str)
+        self.etag = hashlib.sha1(body.encode()).hexdigest()
+
+class ResultCache:
+    """Cache de resultados agregados com TTL, limite de tamanho (LRU) e invalidação explícita.
+
+    Com `version` (função que lê do banco uma marca dos dados, ex.: a última
+    escrita no rollup), o cache é invalidado quando a marca muda, consultada
+    no máximo uma vez a cada `version_interval` segundos: cargas feitas por
+    outros processos também invalidam, sem esperar o TTL.
+    """
+
+    def __init__(self, ttl=60, maxsize=256, version=None, version_interval=1.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.version = version
+        self.version_interval = version_interval
+        self._data_version = None
+        self._version_checked_at = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Incrementada a cada invalidação: resultado calculado antes dela não entra no cache
+        self.generation = 0
+
+    @staticmethod
+    def make_key(name, **params):
+        """Chave a partir dos filtros normalizados (ordem e vazios não importam)"""
+        normalized = []
+        for key, value in sorted(params.items()):
+            if value is None or value == '':
+                continue
+            if isinstance(value, (list, tuple)):
+                value = tuple(None if v in (None, '') else v for v in value)
+                if all(v is None for v in value):
+                    continue
+            elif isinstance(value, str):
+                value = value.strip()
+            normalized.append((key, value))
+        return (name, tuple(normalized))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, generation=None):
+        entry = CacheEntry(value, self.ttl)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def check_version(self):
+        """Invalida o cache se a marca dos dados mudou desde a última consulta"""
+        if self.version is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            checked_at = self._version_checked_at
+            if checked_at is not None and now - checked_at < self.version_interval:
+                return
+            self._version_checked_at = now
+        try:
+            current = self.version()
+        except Exception as e:
+            # Sem a marca, as entradas seguem valendo até o TTL
+            logger.warning(f"Falha ao consultar a versão dos dados: {e}")
+            return
+        with self._lock:
+            if current == self._data_version:
+                return
+            self._data_version = current
+            self.generation += 1
+            self._entries.clear()
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True):
+        """Devolve a entrada em cache ou calcula, guardando só resultados `cacheable`"""
+        self.check_version()
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        generation = self.generation
+        value = compute()
+        if not cacheable(value):
+            return CacheEntry(value, 0)
+        return self.put(key, value, generation)
+
+    def invalidate(self, *args, **kwargs):
+        """Descarta tudo (chamado após uma carga bem-sucedida do ETL)"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
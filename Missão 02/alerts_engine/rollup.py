@@ -0,0 +1,143 @@
+import logging
+from datetime import date
+
+if __package__:
+    from .rules import DEFAULT_RULES
+else:  # importado pelos scripts do motor de alertas
+    from rules import DEFAULT_RULES
+
+logger = logging.getLogger('hemogram_rollup')
+
+# Contadores do rollup e a regra de alerta que define cada limiar
+ROLLUP_COUNTERS = {
+    'anemia_severe': 'hb_lt_8',
+    'anemia_moderate': 'hb_lt_10',
+    'thrombocytopenia_severe': 'platelets_lt_50k',
+    'thrombocytopenia_moderate': 'platelets_lt_100k',
+    'leukopenia': 'wbc_lt_2',
+}
+
+# Idade exata (anos) na chave: qualquer filtro de idade inteiro sai do rollup
+UNKNOWN_AGE = -1
+
+ROLLUP_KEY_COLUMNS = ('day', 'municipality_code', 'patient_age', 'sex')
+ROLLUP_VALUE_COLUMNS = (
+    'exam_count',
+    'hemoglobin_count', 'hemoglobin_sum',
+    'platelets_count', 'platelets_sum',
+    'leukocytes_count', 'leukocytes_sum',
+) + tuple(ROLLUP_COUNTERS)
+
+def _counter_expressions():
+    rules = {rule.condition: rule for rule in DEFAULT_RULES}
+    expressions = []
+    params = {}
+    for i, (counter, condition) in enumerate(ROLLUP_COUNTERS.items()):
+        rule = rules[condition]
+        clause, rule_params = rule.to_sql(f"c{i}", {rule.field: f"h.{rule.field}"})
+        expressions.append(f"count(*) FILTER (WHERE {clause}) AS {counter}")
+        params.update(rule_params)
+    return expressions, params
+
+def _aggregate_sql(where):
+    counters, params = _counter_expressions()
+    sql = f"""
+        SELECT h.exam_date AS day,
+               h.municipality_code,
+               coalesce(h.patient_age, {UNKNOWN_AGE}) AS patient_age,
+               coalesce(p.sex, 'U') AS sex,
+               count(*) AS exam_count,
+               count(h.hemoglobin) AS hemoglobin_count,
+               coalesce(sum(h.hemoglobin), 0) AS hemoglobin_sum,
+               count(h.platelets) AS platelets_count,
+               coalesce(sum(h.platelets), 0) AS platelets_sum,
+               count(h.leukocytes) AS leukocytes_count,
+               coalesce(sum(h.leukocytes), 0) AS leukocytes_sum,
+               {', '.join(counters)}
+        FROM hemogram h
+        LEFT JOIN patient p ON p.patient_hash = h.patient_hash
+        WHERE h.is_valid = true
+        AND h.municipality_code IS NOT NULL
+        AND {where}
+        GROUP BY 1, 2, 3, 4
+    """
+    return sql, params
+
+def _upsert_sql(select_sql):
+    columns = ROLLUP_KEY_COLUMNS + ROLLUP_VALUE_COLUMNS
+    updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in ROLLUP_VALUE_COLUMNS)
+    return f"""
+        INSERT INTO hemogram_daily_rollup ({', '.join(columns)})
+        {select_sql}
+        ON CONFLICT ({', '.join(ROLLUP_KEY_COLUMNS)}) DO UPDATE
+          SET {updates}, updated_at = now()
+    """
+
+def refresh_daily_rollup(conn, keys):
+    """Recalcula o rollup apenas dos pares (dia, município) afetados por uma carga.
+
+    Os grupos são recalculados a partir de hemogram (não somados ao valor
+    anterior), então reenvio do mesmo sample_id não conta em dobro. O filtro
+    vai direto em exam_date (chave de partição): só os meses do bloco são lidos.
+    """
+    keys = sorted({(str(day), str(municipality_code)) for day, municipality_code in keys})
+    if not keys:
+        return 0
+    days = sorted({day for day, _ in keys})
+    municipalities = sorted({municipality_code for _, municipality_code in keys})
+    from sqlalchemy import text
+    select_sql, params = _aggregate_sql("""
+        h.municipality_code = ANY(CAST(:municipalities AS text[]))
+        AND h.exam_date = ANY(CAST(:days AS date[]))
+    """)
+    result = conn.execute(
+        text(_upsert_sql(select_sql)),
+        {'days': days, 'municipalities': municipalities, **params}
+    )
+    return result.rowcount
+
+def rebuild_daily_rollup(conn, since=None):
+    """Reconstrói o rollup a partir de hemogram (carga inicial ou correção)"""
+    from sqlalchemy import text
+    if since is None:
+        conn.execute(text("TRUNCATE hemogram_daily_rollup"))
+        select_sql, params = _aggregate_sql("true")
+    else:
+        conn.execute(text("DELETE FROM hemogram_daily_rollup WHERE day >= :since"), {'since': since})
+        select_sql, params = _aggregate_sql("h.exam_date >= :since")
+        params['since'] = since
+    result = conn.execute(text(_upsert_sql(select_sql)), params)
+    logger.info(f"Rollup diário reconstruído: {result.rowcount} grupos")
+    return result.rowcount
+
+def rollup_version(conn):
+    """Última escrita no rollup: muda a cada carga (upload, CLI, ingestão em lote) ou reconstrução"""
+    from sqlalchemy import text
+    return conn.execute(text("SELECT max(updated_at) FROM hemogram_daily_rollup")).scalar()
+
+def affected_rollup_keys(processed_df):
+    """Pares (dia, município) de um bloco carregado; sem exam_date vale a data de hoje"""
+    if processed_df.empty:
+        return []
+    today = date.today().isoformat()
+    if 'exam_date' in processed_df.columns:
+        days = processed_df['exam_date'].astype(object).where(processed_df['exam_date'].notna(), today)
+    else:
+        days = [today] * len(processed_df)
+    return set(zip(days, processed_df['municipality_code']))
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from runtime import get_engine
+
+    parser = argparse.ArgumentParser(description="Rollup diário de hemogram (hemogram_daily_rollup)")
+    parser.add_argument('--since', type=date.fromisoformat,
+                        help="reconstrói só a partir desta data (AAAA-MM-DD); sem ela, tudo")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with get_engine().begin() as conn:
+        rebuild_daily_rollup(conn, args.since)
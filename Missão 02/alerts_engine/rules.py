@@ -0,0 +1,108 @@
+import operator
+
+from runtime import lazy_import
+
+np = lazy_import('numpy')
+
+# Operadores aceitos nas regras; 'between' usa limites (mínimo, máximo) com
+# mínimo inclusivo e máximo exclusivo, como em `50000 <= x < 100000`
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+class AlertRule:
+    """Regra de alerta declarativa: campo, operador, limites, severidade e mensagem.
+
+    A mesma definição compila para um predicado SQL (pushdown para o banco,
+    aproveitando os índices do campo) e para uma máscara vetorizada sobre um
+    lote em memória.
+    """
+
+    def __init__(self, condition, field, op, bounds, severity, message):
+        if op != 'between' and op not in OPERATORS:
+            raise ValueError(f"Operador não suportado: {op}")
+        self.condition = condition
+        self.field = field
+        self.op = op
+        self.bounds = tuple(bounds) if op == 'between' else (bounds,)
+        self.severity = severity
+        self.message = message
+
+    def column(self, columns=None):
+        """Nome real da coluna (o schema do template usa wbc em vez de leukocytes)"""
+        return (columns or {}).get(self.field, self.field)
+
+    def to_sql(self, param_prefix, columns=None):
+        """Predicado SQL parametrizado: (cláusula, parâmetros)"""
+        column = self.column(columns)
+        if self.op == 'between':
+            low, high = f"{param_prefix}_low", f"{param_prefix}_high"
+            return (f"({column} >= :{low} AND {column} < :{high})",
+                    {low: self.bounds[0], high: self.bounds[1]})
+        name = f"{param_prefix}_value"
+        return f"({column} {self.op} :{name})", {name: self.bounds[0]}
+
+    def mask(self, values):
+        """Máscara booleana sobre um array float (NaN nunca dispara)"""
+        with np.errstate(invalid='ignore'):
+            if self.op == 'between':
+                return (values >= self.bounds[0]) & (values < self.bounds[1])
+            return OPERATORS[self.op](values, self.bounds[0])
+
+class RuleSet:
+    """Conjunto de regras compilado uma vez para SQL e para avaliação vetorizada"""
+
+    def __init__(self, rules, columns=None):
+        self.rules = list(rules)
+        self.columns = columns or {}
+
+    @property
+    def fields(self):
+        return sorted({rule.field for rule in self.rules})
+
+    def where_clause(self):
+        """OR de todas as regras: só linhas que disparam alguma regra saem do banco"""
+        clauses = []
+        params = {}
+        for i, rule in enumerate(self.rules):
+            clause, rule_params = rule.to_sql(f"r{i}", self.columns)
+            clauses.append(clause)
+            params.update(rule_params)
+        if not clauses:
+            return "false", params
+        return "(" + " OR ".join(clauses) + ")", params
+
+    def evaluate(self, frame):
+        """Para cada regra com ocorrências: (regra, posições no lote, valores do campo)"""
+        if frame.empty:
+            return
+        import pandas as pd  # só quem avalia lotes paga o import (o ETL usa apenas DEFAULT_RULES)
+        numeric = {}
+        for field in self.fields:
+            column = self.columns.get(field, field)
+            if column in frame.columns:
+                numeric[field] = pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=float)
+        for rule in self.rules:
+            values = numeric.get(rule.field)
+            if values is None:
+                continue
+            positions = np.flatnonzero(rule.mask(values))
+            if len(positions):
+                yield rule, positions, values
+
+# Critérios médicos padrão (fonte única para o AlertEngine e o template)
+DEFAULT_RULES = [
+    AlertRule('platelets_lt_50k', 'platelets', '<', 50000, 3,
+              'Plaquetas baixas (< 50.000) - risco hemorrágico'),
+    AlertRule('platelets_lt_100k', 'platelets', 'between', (50000, 100000), 2,
+              'Plaquetas moderadamente baixas (< 100.000)'),
+    AlertRule('hb_lt_8', 'hemoglobin', '<', 8, 3,
+              'Hemoglobina baixa (< 8 g/dL) - anemia moderada'),
+    AlertRule('hb_lt_10', 'hemoglobin', 'between', (8, 10), 2,
+              'Hemoglobina moderadamente baixa (< 10 g/dL)'),
+    AlertRule('wbc_lt_2', 'leukocytes', '<', 2.0, 3,
+              'Leucócitos baixos (< 2.000) - risco infeccioso'),
+]
@@ -0,0 +1,299 @@
+import logging
+import queue
+import select
+import threading
+from collections import deque
+from sqlalchemy import text
+
+if __package__:
+    from .writer import ALERT_CHANNEL, json_number
+else:
+    from writer import ALERT_CHANNEL, json_number
+
+from telemetry import REGISTRY
+
+logger = logging.getLogger('alert_stream')
+
+# Alerta com os valores do hemograma, no formato de GET /alerts. O LATERAL
+# pega um hemograma por amostra: a constraint de hemogram é por sample_id + data
+# (a unicidade de sample_id vem de hemogram_sample_key, que o planner não conhece).
+ALERT_DELTA_QUERY = """
+    SELECT a.id, a.alert_at, a.condition, a.severity, a.sample_id,
+           a.municipality_code, h.patient_age, h.hemoglobin,
+           h.platelets, h.leukocytes
+    FROM alert a
+    LEFT JOIN LATERAL (
+        SELECT patient_age, hemoglobin, platelets, leukocytes
+        FROM hemogram
+        WHERE sample_id = a.sample_id
+        ORDER BY exam_date DESC
+        LIMIT 1
+    ) h ON true
+    WHERE a.id > :after_id AND a.id <= :upto_id
+"""
+
+# Último id já sorteado para alert e transações que gravam em alert agora.
+# Quem sorteou um id ainda segura o RowExclusiveLock da tabela até o commit.
+ALERT_DRAWN_QUERY = """
+    SELECT coalesce(pg_sequence_last_value(pg_get_serial_sequence('alert', 'id')), 0)
+"""
+ALERT_WRITERS_QUERY = """
+    SELECT DISTINCT s.pid, s.xact_start
+    FROM pg_locks l
+    JOIN pg_stat_activity s ON s.pid = l.pid
+    WHERE l.locktype = 'relation' AND l.relation = 'alert'::regclass
+    AND l.mode = 'RowExclusiveLock' AND l.pid <> pg_backend_pid()
+"""
+ALERT_WRITERS_RUNNING_QUERY = """
+    SELECT count(*)
+    FROM pg_stat_activity s
+    JOIN unnest(CAST(:pids AS int[]), CAST(:starts AS timestamptz[])) AS w(pid, xact_start)
+      ON s.pid = w.pid AND s.xact_start = w.xact_start
+"""
+
+def alert_to_dict(row):
+    """Linha de alerta (com colunas do hemograma) em dict serializável"""
+    return {
+        'id': row.id,
+        'alert_at': row.alert_at.isoformat() if row.alert_at else None,
+        'condition': row.condition,
+        'severity': row.severity,
+        'sample_id': row.sample_id,
+        'municipality_code': row.municipality_code,
+        'patient_age': row.patient_age,
+        'hemoglobin': json_number(row.hemoglobin),
+        'platelets': row.platelets,
+        'leukocytes': json_number(row.leukocytes),
+    }
+
+class Subscription:
+    """Fila de um cliente do stream, com cursor (último id entregue) e filtro de gravidade"""
+
+    def __init__(self, broadcaster, cursor, min_severity=1, maxsize=100):
+        self.broadcaster = broadcaster
+        self.cursor = cursor
+        self.min_severity = min_severity
+        self.lagging = False
+        self._queue = queue.Queue(maxsize)
+
+    def offer(self, alerts):
+        """Chamado pelo broadcaster; devolve False se o cliente não acompanha o ritmo"""
+        try:
+            self._queue.put_nowait(alerts)
+            return True
+        except queue.Full:
+            self.lagging = True
+            return False
+
+    def get(self, timeout):
+        """Alertas novos para o cliente ([] no timeout); None se a assinatura caiu por atraso.
+
+        Um cliente descartado reconecta com Last-Event-ID e recebe o delta
+        pelo cursor, sem perder alertas.
+        """
+        try:
+            alerts = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None if self.lagging else []
+        fresh = []
+        for alert in alerts:
+            if self.cursor is not None and alert['id'] <= self.cursor:
+                continue
+            self.cursor = alert['id']
+            if (alert['severity'] or 0) >= self.min_severity:
+                fresh.append(alert)
+        return fresh
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+class AlertBroadcaster:
+    """Repassa os alertas novos a todos os clientes SSE do processo.
+
+    Uma thread mantém uma conexão dedicada em LISTEN no canal do AlertWriter
+    e, a cada NOTIFY (ou a cada `poll_interval` s, se nada chegar), faz uma
+    única consulta `id > último visto` para todos os clientes. Os alertas
+    recentes ficam num buffer em memória: reconexões com cursor dentro dele
+    não tocam no banco.
+
+    O cursor só avança até um id abaixo do qual nenhum alerta pode mais ser
+    confirmado (ver _safe_id): assim `id > cursor` não perde um id menor
+    gravado por uma transação que terminou depois, nem ao vivo nem na
+    reconexão. Enquanto há gravação pendente, a verificação se repete a cada
+    `pending_interval` s.
+    """
+
+    def __init__(self, db_engine, buffer_size=1000, poll_interval=30.0, batch_limit=500,
+                 retry_interval=5.0, pending_interval=0.5):
+        self.engine = db_engine
+        self.poll_interval = poll_interval
+        self.pending_interval = pending_interval
+        self.batch_limit = batch_limit
+        self.retry_interval = retry_interval
+        self._buffer = deque(maxlen=buffer_size)
+        self._floor = None      # alertas com id > _floor estão todos no buffer
+        self._last_id = None
+        self._pending = None    # (último id sorteado, transações que gravavam em alert)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Inicia a escuta no primeiro cliente (importar a API não abre conexão)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            # Com gravações em andamento o início fica no max(id) visível
+            self._pending = None
+            with self.engine.connect() as conn:
+                self._last_id = conn.execute(text("SELECT coalesce(max(id), 0) FROM alert")).scalar()
+                self._floor = self._last_id = self._safe_id(conn)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='alert-stream', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(self.poll_interval + 1)
+        self._thread = None
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def subscribe(self, after_id=None, min_severity=1, maxsize=100):
+        """Registra um cliente; com `after_id`, já enfileira os alertas posteriores a ele.
+
+        Sem cursor o cliente recebe só o que chegar daqui em diante. Cursor
+        mais antigo que o buffer vai ao banco, limitado aos `batch_limit`
+        alertas mais recentes.
+        """
+        self.start()
+        backlog = []
+        with self._lock:
+            covered = after_id is None or after_id >= self._floor
+        if not covered:
+            backlog = self._query_latest(after_id)
+        with self._lock:
+            cursor = after_id if after_id is not None else self._last_id
+            subscription = Subscription(self, cursor, min_severity, maxsize)
+            seen = backlog[-1]['id'] if backlog else cursor
+            backlog += [alert for alert in self._buffer if alert['id'] > seen]
+            # Ainda sob o lock: o backlog entra na fila antes de qualquer alerta novo
+            if backlog:
+                subscription.offer(backlog)
+            self._subscribers.add(subscription)
+        REGISTRY.count('alert_stream_subscriptions')
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _query_latest(self, after_id):
+        # Só até o cursor do broadcaster: o que vem depois chega pela fila
+        with self._lock:
+            upto_id = self._last_id
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(ALERT_DELTA_QUERY + " ORDER BY a.id DESC LIMIT :limit"),
+                {'after_id': after_id, 'upto_id': upto_id, 'limit': self.batch_limit}
+            ).fetchall()
+        return [alert_to_dict(row) for row in reversed(rows)]
+
+    def _safe_id(self, conn):
+        """Maior alert.id até o qual não pode mais surgir alerta novo.
+
+        O id sai no INSERT, não no commit. Lê primeiro o último id sorteado e
+        depois quem grava em alert: quem tem um id até ele e ainda não
+        terminou está nessa lista. Sem gravações o limite é esse id; senão ele
+        fica pendente e só vale quando aquelas transações terminarem. Até lá
+        fica o cursor atual.
+        """
+        drawn = conn.execute(text(ALERT_DRAWN_QUERY)).scalar()
+        writers = conn.execute(text(ALERT_WRITERS_QUERY)).fetchall()
+        if not writers:
+            self._pending = None
+            return max(drawn, self._last_id)
+        safe_id = self._last_id
+        if self._pending is not None:
+            pending_id, pending_writers = self._pending
+            running = conn.execute(
+                text(ALERT_WRITERS_RUNNING_QUERY),
+                {'pids': [w.pid for w in pending_writers],
+                 'starts': [w.xact_start for w in pending_writers]}
+            ).scalar()
+            if running:
+                REGISTRY.count('alert_stream_pending')
+                return safe_id
+            safe_id = max(pending_id, safe_id)
+        self._pending = (drawn, writers)
+        return safe_id
+
+    def _fetch_new(self):
+        """Lê (em páginas de `batch_limit`) e publica os alertas entre o último visto e o limite seguro"""
+        with self.engine.connect() as conn:
+            upto_id = self._safe_id(conn)
+        while self._last_id < upto_id:
+            with REGISTRY.stage('alerts.stream_fetch'):
+                with self.engine.connect() as conn:
+                    rows = conn.execute(
+                        text(ALERT_DELTA_QUERY + " ORDER BY a.id LIMIT :limit"),
+                        {'after_id': self._last_id, 'upto_id': upto_id, 'limit': self.batch_limit}
+                    ).fetchall()
+            if rows:
+                self._publish([alert_to_dict(row) for row in rows])
+            if len(rows) < self.batch_limit:
+                break
+        # Ids sem linha (conflito, rollback) até o limite também ficam para trás
+        with self._lock:
+            self._last_id = max(self._last_id, upto_id)
+
+    def _publish(self, alerts):
+        with self._lock:
+            for alert in alerts:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._floor = self._buffer[0]['id']
+                self._buffer.append(alert)
+            self._last_id = alerts[-1]['id']
+            lagging = [s for s in self._subscribers if not s.offer(alerts)]
+            for subscription in lagging:
+                self._subscribers.discard(subscription)
+        REGISTRY.count('alert_stream_published', len(alerts))
+        if lagging:
+            REGISTRY.count('alert_stream_dropped', len(lagging))
+            logger.warning(f"{len(lagging)} cliente(s) do stream descartados por atraso")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                REGISTRY.count('alert_stream_errors')
+                logger.warning(f"Escuta de alertas interrompida ({e}); nova tentativa em "
+                               f"{self.retry_interval}s")
+                self._stop.wait(self.retry_interval)
+
+    def _listen(self):
+        raw = self.engine.raw_connection()
+        dbapi = raw.driver_connection
+        # Conexão dedicada: fica fora do pool enquanto escuta e é fechada no fim
+        raw.detach()
+        try:
+            dbapi.autocommit = True
+            with dbapi.cursor() as cursor:
+                cursor.execute(f"LISTEN {ALERT_CHANNEL}")
+            # O que foi gravado antes do LISTEN (início ou reconexão)
+            self._fetch_new()
+            while not self._stop.is_set():
+                timeout = self.pending_interval if self._pending else self.poll_interval
+                ready, _, _ = select.select([dbapi], [], [], timeout)
+                if ready:
+                    dbapi.poll()
+                    dbapi.notifies.clear()
+                self._fetch_new()
+        finally:
+            dbapi.close()
@@ -0,0 +1,99 @@
+import math
+from bisect import insort
+from collections import deque
+from datetime import timedelta
+
+class TrendRule:
+    """Regra temporal: queda percentual de um campo do mesmo paciente dentro de uma janela"""
+
+    def __init__(self, condition, field, drop_pct, window, severity, message):
+        self.condition = condition
+        self.field = field
+        self.drop_pct = drop_pct
+        self.window = window
+        self.severity = severity
+        self.message = message
+
+    def check(self, ts, value, history):
+        """Compara o exame novo com o maior valor anterior dentro da janela.
+
+        Devolve (valor de referência, sample_id de referência, queda) ou None.
+        """
+        if value is None or math.isnan(value):
+            return None
+        baseline = None
+        for entry_ts, sample_id, values in history:
+            previous = values.get(self.field)
+            if entry_ts < ts - self.window or previous is None or math.isnan(previous):
+                continue
+            if baseline is None or previous > baseline[0]:
+                baseline = (previous, sample_id)
+        if baseline is None or baseline[0] <= 0:
+            return None
+        drop = (baseline[0] - value) / baseline[0]
+        # Tolerância para arredondamento de ponto flutuante (ex.: 10 -> 8.5)
+        if drop >= self.drop_pct - 1e-9:
+            return baseline[0], baseline[1], round(drop, 4)
+        return None
+
+class PatientWindowIndex:
+    """Exames recentes por patient_hash, em buffers circulares ordenados por tempo.
+
+    Guarda só o necessário para as regras temporais (timestamp, sample_id e os
+    campos monitorados). Entradas mais antigas que a janela são descartadas
+    conforme o relógio do índice (maior timestamp visto) avança.
+    """
+
+    def __init__(self, window=timedelta(hours=72), fields=('hemoglobin', 'platelets'),
+                 max_per_patient=32):
+        self.window = window
+        self.fields = tuple(fields)
+        self.max_per_patient = max_per_patient
+        self.latest = None
+        self._series = {}
+
+    def __len__(self):
+        return len(self._series)
+
+    def history(self, patient_hash, ts):
+        """Exames do paciente anteriores a ts, dentro da janela"""
+        entries = self._series.get(patient_hash)
+        if not entries:
+            return []
+        return [e for e in entries if ts - self.window <= e[0] < ts]
+
+    def add(self, patient_hash, ts, sample_id, values):
+        entries = self._series.get(patient_hash)
+        if entries is None:
+            entries = self._series[patient_hash] = deque(maxlen=self.max_per_patient)
+        entry = (ts, sample_id, {f: values.get(f) for f in self.fields})
+        if not entries or entries[-1][0] <= ts:
+            entries.append(entry)
+        else:
+            # Chegada fora de ordem: reinsere mantendo a ordem temporal
+            ordered = list(entries)
+            insort(ordered, entry, key=lambda e: e[0])
+            entries.clear()
+            entries.extend(ordered[-self.max_per_patient:])
+        if self.latest is None or ts > self.latest:
+            self.latest = ts
+
+    def evict(self):
+        """Remove entradas fora da janela e pacientes sem exames recentes"""
+        if self.latest is None:
+            return
+        cutoff = self.latest - self.window
+        for patient_hash in list(self._series):
+            entries = self._series[patient_hash]
+            while entries and entries[0][0] < cutoff:
+                entries.popleft()
+            if not entries:
+                del self._series[patient_hash]
+
+# Backlog F4: "Queda >=15% em 72h"
+DEFAULT_TREND_RULES = [
+    TrendRule('hb_drop_15pct_72h', 'hemoglobin', 0.15, timedelta(hours=72), 2,
+              'Queda de hemoglobina >= 15% em 72h'),
+    TrendRule('platelets_drop_15pct_72h', 'platelets', 0.15, timedelta(hours=72), 2,
+              'Queda de plaquetas >= 15% em 72h'),
+]
@@ -0,0 +1,116 @@
+import hashlib
+from collections import OrderedDict
+from decimal import Decimal
+
+def alert_table():
+    """Tabela alert do insert em lote; o sqlalchemy só é importado no primeiro flush"""
+    from sqlalchemy import column, table
+    from sqlalchemy.dialects.postgresql import JSONB
+    return table(
+        'alert',
+        column('alert_key'),
+        column('condition'),
+        column('severity'),
+        column('sample_id'),
+        column('patient_hash'),
+        column('municipality_code'),
+        column('payload', JSONB),
+    )
+
+# Canal do NOTIFY emitido a cada flush com alertas novos (ver alerts_engine/stream.py)
+ALERT_CHANNEL = 'hemogram_alerts'
+
+def make_alert_key(condition, sample_id):
+    """Cria chave única para evitar alertas duplicados"""
+    return hashlib.sha1(f"{condition}|{sample_id}".encode()).hexdigest()
+
+def json_number(value):
+    """Decimal/NUMERIC do banco não é serializável em JSON"""
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+class RecentKeyCache:
+    """LRU limitado com os alert_keys emitidos recentemente"""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+
+class AlertWriter:
+    """Acumula alertas e grava em INSERT multi-linha com ON CONFLICT (alert_key) DO NOTHING.
+
+    Chaves já vistas no LRU nem chegam ao banco. As chaves só entram no LRU
+    via remember(), depois que a transação que as gravou foi confirmada.
+    """
+
+    def __init__(self, batch_size=1000, recent_keys=None):
+        self.batch_size = batch_size
+        self.recent_keys = recent_keys if recent_keys is not None else RecentKeyCache()
+        self._pending = []
+        self._pending_keys = set()
+
+    def add(self, condition, severity, sample_id, patient_hash, municipality_code, payload):
+        """Enfileira um alerta; devolve False se é duplicata óbvia (LRU ou já pendente)"""
+        key = make_alert_key(condition, sample_id)
+        if key in self._pending_keys or key in self.recent_keys:
+            return False
+        self._pending_keys.add(key)
+        self._pending.append({
+            'alert_key': key,
+            'condition': condition,
+            'severity': severity,
+            'sample_id': sample_id,
+            'patient_hash': patient_hash,
+            'municipality_code': municipality_code,
+            'payload': {k: json_number(v) for k, v in payload.items()},
+        })
+        return True
+
+    def discard(self):
+        self._pending = []
+        self._pending_keys = set()
+
+    def flush(self, conn):
+        """Grava os pendentes na conexão/transação dada; devolve (inseridos, chaves enviadas).
+
+        Se algo foi inserido, emite NOTIFY em ALERT_CHANNEL na mesma transação:
+        o Postgres só o entrega no COMMIT, então quem escuta nunca vê alerta
+        de transação desfeita.
+        """
+        from sqlalchemy import text
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        pending, keys = self._pending, list(self._pending_keys)
+        self.discard()
+        inserted = 0
+        for start in range(0, len(pending), self.batch_size):
+            stmt = (
+                pg_insert(alert_table())
+                .values(pending[start:start + self.batch_size])
+                .on_conflict_do_nothing(index_elements=['alert_key'])
+            )
+            inserted += conn.execute(stmt).rowcount
+        if inserted:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                         {'channel': ALERT_CHANNEL, 'payload': str(inserted)})
+        return inserted, keys
+
+    def remember(self, keys):
+        """Registra no LRU chaves cuja transação já foi confirmada"""
+        for key in keys:
+            self.recent_keys.add(key)
@@ -1,11 +1,248 @@
-from flask import Flask, request, jsonify, render_template
+import json
+import os
+import threading
+import time
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-from etl.etl import process_hemogram_file
+from etl.etl import DataProcessor, make_archive, register_load_listener, run_hemogram_etl
+from etl.jobs import IngestJobQueue, QueueFull
 from alerts_engine.alerts_engine import AlertEngine, MetricsCalculator
-from sqlalchemy import create_engine
+from alerts_engine.cache import ResultCache
+from alerts_engine.rollup import rollup_version
+from alerts_engine.stream import AlertBroadcaster, alert_to_dict
+from runtime import get_engine
+from telemetry import REGISTRY
+from sqlalchemy import text
 import logging
 
-# ... (o resto do seu app.py existente aqui) ...
+logger = logging.getLogger('hemogram_api')
+
+# Mesmo engine (e pool) usado pelo ETL dos uploads: DATABASE_URL e DB_POOL_* no ambiente
+engine = get_engine()
+
+app = Flask(__name__)
+CORS(app)
+
+# Cópia em Parquet dos uploads e leitura das janelas longas (HEMOGRAM_ARCHIVE_DIR, opcional)
+archive = make_archive()
+metrics_calculator = MetricsCalculator(engine, archive=archive)
+alert_engine = AlertEngine(engine)
+
+def data_version():
+    """Última escrita no rollup diário, de onde saem métricas e heatmap"""
+    with engine.connect() as conn:
+        return rollup_version(conn)
+
+# Métricas e heatmap só mudam quando o rollup diário é atualizado: cargas de
+# qualquer processo (CLI, ingestão em lote) mudam sua última escrita, e o
+# cache é invalidado; uploads neste processo invalidam na hora
+result_cache = ResultCache(
+    ttl=int(os.environ.get('API_CACHE_TTL', 60)),
+    maxsize=int(os.environ.get('API_CACHE_SIZE', 256)),
+    version=data_version,
+    version_interval=float(os.environ.get('API_CACHE_VERSION_INTERVAL', 1))
+)
+register_load_listener(result_cache.invalidate)
+
+# O AlertEngine mantém estado em memória (writer, índice de pacientes):
+# os workers de ingestão avaliam alertas um de cada vez
+alerts_lock = threading.Lock()
+
+def run_upload_job(job):
+    """Ingestão de um upload em segundo plano, seguida da avaliação de alertas"""
+    processor = DataProcessor()
+    job.stats = processor.stats
+    report = run_hemogram_etl(job.path, processor=processor, on_chunk=job.progress, db_engine=engine,
+                              archive=archive)
+    job.progress(report['processed'])
+    with alerts_lock:
+        job.result['alerts_generated'] = alert_engine.process_alerts()
+    job.result['rows_loaded'] = report['rows_loaded']
+
+# Alertas novos empurrados aos dashboards via SSE: uma escuta (LISTEN) e uma
+# consulta por lote de alertas no processo, não uma por cliente
+alert_stream = AlertBroadcaster(
+    engine,
+    buffer_size=int(os.environ.get('ALERT_STREAM_BUFFER', 1000)),
+    poll_interval=float(os.environ.get('ALERT_STREAM_POLL_INTERVAL', 30))
+)
+# Comentário SSE periódico: mantém a conexão viva em proxies e detecta cliente desconectado
+SSE_KEEPALIVE = float(os.environ.get('ALERT_STREAM_KEEPALIVE', 15))
+
+upload_jobs = IngestJobQueue(
+    run_upload_job,
+    workers=int(os.environ.get('UPLOAD_WORKERS', 2)),
+    max_pending=int(os.environ.get('UPLOAD_MAX_PENDING', 8)),
+    spool_dir=os.environ.get('UPLOAD_SPOOL_DIR')
+)
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Latência por rota (endpoint do Flask, não a URL: rótulos com cardinalidade fixa)"""
+    started = g.pop('started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REGISTRY.observe('http_seconds', time.perf_counter() - started, endpoint=endpoint)
+        REGISTRY.count('http_requests', endpoint=endpoint, status=response.status_code)
+    return response
+
+def query_int(name, default=None):
+    """Parâmetro inteiro da query string ('null' e vazio valem como ausente)"""
+    value = request.args.get(name)
+    if value is None or value.strip() in ('', 'null', 'undefined'):
+        return default
+    return int(value)
+
+def cached_response(entry):
+    """Resposta JSON com ETag/Last-Modified; devolve 304 se o cliente já tem a versão"""
+    response = jsonify(entry.value)
+    response.set_etag(entry.etag)
+    response.last_modified = entry.created_at
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def metrics():
+    try:
+        age_min = query_int('age_min')
+        age_max = query_int('age_max')
+        days_back = query_int('days_back', 30)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    municipality_code = request.args.get('municipality_code')
+    if municipality_code in ('', 'null', 'undefined'):
+        municipality_code = None
+    age_range = (age_min, age_max) if age_min is not None or age_max is not None else None
+
+    key = ResultCache.make_key('metrics', age_range=age_range,
+                               municipality_code=municipality_code, days_back=days_back)
+    entry = result_cache.get_or_compute(
+        key,
+        lambda: metrics_calculator.get_basic_metrics(age_range, municipality_code, days_back),
+        cacheable=bool  # {} indica erro no cálculo
+    )
+    return cached_response(entry)
+
+@app.route('/heatmap')
+def heatmap():
+    try:
+        days_back = query_int('days_back', 30)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    key = ResultCache.make_key('heatmap', days_back=days_back)
+    entry = result_cache.get_or_compute(
+        key,
+        lambda: {'heatmap_data': metrics_calculator.get_municipality_heatmap(days_back)},
+        cacheable=lambda value: bool(value['heatmap_data'])
+    )
+    return cached_response(entry)
+
+@app.route('/alerts')
+def alerts():
+    try:
+        days_back = query_int('days_back', 1)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT a.id, a.alert_at, a.condition, a.severity, a.sample_id,
+                       a.municipality_code, h.patient_age, h.hemoglobin,
+                       h.platelets, h.leukocytes
+                FROM alert a
+                LEFT JOIN LATERAL (
+                    SELECT patient_age, hemoglobin, platelets, leukocytes
+                    FROM hemogram
+                    WHERE sample_id = a.sample_id
+                    ORDER BY exam_date DESC
+                    LIMIT 1
+                ) h ON true
+                WHERE a.alert_at >= now() - make_interval(days => :days_back)
+                ORDER BY a.alert_at DESC, a.id DESC
+                LIMIT 500
+            """),
+            {'days_back': days_back}
+        ).fetchall()
+    return jsonify({'alerts': [alert_to_dict(r) for r in rows]})
+
+@app.route('/alerts/stream')
+def alerts_stream():
+    """Server-Sent Events com os alertas novos.
+
+    O cursor é o id do último alerta recebido: `Last-Event-ID` (enviado pelo
+    EventSource ao reconectar) ou `?after_id=`; só o delta é enviado. Sem
+    cursor, apenas alertas posteriores à conexão. `?min_severity=` filtra.
+    """
+    try:
+        after_id = request.headers.get('Last-Event-ID') or request.args.get('after_id')
+        after_id = int(after_id) if after_id not in (None, '', 'null', 'undefined') else None
+        min_severity = query_int('min_severity', 1)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    subscription = alert_stream.subscribe(after_id, min_severity)
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                alerts = subscription.get(timeout=SSE_KEEPALIVE)
+                if alerts is None:
+                    return  # cliente atrasado: o EventSource reconecta a partir do cursor
+                if not alerts:
+                    yield ": keepalive\n\n"
+                    continue
+                for alert in alerts:
+                    yield f"id: {alert['id']}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+                REGISTRY.count('alert_stream_sent', len(alerts))
+        finally:
+            subscription.close()
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: não segurar os eventos em buffer
+    return response
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    """Grava o arquivo no spool e enfileira a ingestão; responde 202 com o id do job"""
+    file = request.files.get('file')
+    if file is None or not file.filename:
+        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+    try:
+        job = upload_jobs.submit(file.stream, file.filename)
+    except QueueFull:
+        response = jsonify({'error': 'Fila de processamento cheia, tente novamente em instantes'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    response = jsonify({
+        'message': f'Arquivo {file.filename} recebido e enfileirado',
+        'job_id': job.id,
+        'status_url': f'/upload/{job.id}',
+        'queue_depth': upload_jobs.depth
+    })
+    response.headers['Location'] = f'/upload/{job.id}'
+    return response, 202
+
+@app.route('/upload/<job_id>')
+def upload_status(job_id):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/internal/stats')
+def stats():
+    """Contadores e histogramas do processo: texto do Prometheus ou JSON com ?format=json"""
+    if request.args.get('format') == 'json':
+        snapshot = REGISTRY.snapshot()
+        snapshot['upload_queue_depth'] = upload_jobs.depth
+        snapshot['alert_stream_clients'] = alert_stream.subscribers
+        return jsonify(snapshot)
+    return Response(REGISTRY.to_prometheus(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/dashboard')
 def dashboard():
@@ -0,0 +1,165 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+from datetime import date
+
+# Municípios sintéticos de Goiás (código IBGE de 7 dígitos começando em 52)
+DEFAULT_MUNICIPALITIES = 50
+
+# Tipos de corrupção aplicados às linhas inválidas do CSV (validadas por DataProcessor)
+CSV_CORRUPTIONS = ('sample_id', 'municipality_code', 'hemoglobin', 'platelets', 'leukocytes')
+# Tipos de corrupção das linhas NDJSON (validadas por Hemogram no etl_ingest)
+NDJSON_CORRUPTIONS = ('hb', 'sex', 'date', 'platelets', 'json')
+
+def municipality_codes(count):
+    return [f"52{i:05d}" for i in range(1, count + 1)]
+
+def municipality_weights(count, skew):
+    """Distribuição tipo Zipf: skew=0 é uniforme, skew>1 concentra nos primeiros municípios"""
+    ranks = np.arange(1, count + 1, dtype=float)
+    weights = 1.0 / ranks ** skew
+    return weights / weights.sum()
+
+def generate_hemograms(rows, invalid_ratio=0.02, patient_repeat=1.0, municipalities=DEFAULT_MUNICIPALITIES,
+                       municipality_skew=1.0, days=30, end_date=None, seed=42, sample_prefix='SYN'):
+    """DataFrame sintético com as colunas do CSV lido por etl.py.
+
+    `patient_repeat` é o número médio de exames por paciente (pacientes
+    mantêm nascimento, sexo e município, portanto o mesmo patient_hash);
+    `municipality_skew` controla a concentração dos exames por município.
+    A coluna auxiliar `_invalid` indica as linhas corrompidas de propósito.
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or date.today()
+    patients = max(int(rows / max(patient_repeat, 1.0)), 1)
+
+    codes = np.array(municipality_codes(municipalities))
+    patient_municipality = codes[rng.choice(municipalities, size=patients,
+                                            p=municipality_weights(municipalities, municipality_skew))]
+    patient_birth = pd.to_datetime('1930-01-01') + pd.to_timedelta(rng.integers(0, 365 * 90, patients), unit='D')
+    patient_sex = rng.choice(np.array(['M', 'F']), size=patients)
+
+    patient = rng.integers(0, patients, rows)
+    exam_offset = rng.integers(0, days, rows)
+    exam_date = pd.to_datetime(end_date) - pd.to_timedelta(exam_offset, unit='D')
+    birth = patient_birth[patient]
+    age = ((exam_date - birth).days // 365).astype(int)
+
+    df = pd.DataFrame({
+        'sample_id': [f"{sample_prefix}{i:09d}" for i in range(rows)],
+        'municipality_code': patient_municipality[patient],
+        # Distribuições com cauda baixa para disparar alertas em parte das linhas
+        'hemoglobin': np.round(rng.normal(13.0, 2.2, rows).clip(4.0, 20.0), 1),
+        'platelets': np.round(rng.lognormal(np.log(240000), 0.35, rows).clip(8000, 900000)).astype(int),
+        'leukocytes': np.round(rng.lognormal(np.log(7.0), 0.35, rows).clip(0.8, 40.0), 2),
+        'lymphocytes': np.round(rng.normal(2.2, 0.6, rows).clip(0.3, 8.0), 2),
+        'neutrophils': np.round(rng.normal(4.2, 1.2, rows).clip(0.2, 15.0), 2),
+        'exam_date': exam_date.strftime('%Y-%m-%d'),
+        'patient_age': age,
+        'sex': patient_sex[patient],
+        'birth_date': birth.strftime('%Y-%m-%d'),
+        'lab_id': rng.choice(np.array(['LAB01', 'LAB02', 'LAB03', 'LAB04']), size=rows),
+    })
+
+    invalid = rng.random(rows) < invalid_ratio
+    df['_invalid'] = invalid
+    kinds = rng.choice(len(CSV_CORRUPTIONS), size=rows)
+    df = df.astype({'sample_id': object, 'municipality_code': object})
+    for k, column in enumerate(CSV_CORRUPTIONS):
+        target = invalid & (kinds == k)
+        if not target.any():
+            continue
+        if column == 'sample_id':
+            df.loc[target, column] = 'X1'
+        elif column == 'municipality_code':
+            df.loc[target, column] = '52X'
+        elif column == 'hemoglobin':
+            df.loc[target, column] = 45.0
+        elif column == 'platelets':
+            df.loc[target, column] = -1
+        else:
+            df.loc[target, column] = 5000.0
+    return df
+
+def write_csv(df, path):
+    df.drop(columns=['_invalid']).to_csv(path, index=False)
+    return path
+
+def ndjson_lines(df, seed=42):
+    """Linhas FHIR simplificadas (formato do etl_ingest) a partir do DataFrame sintético"""
+    rng = np.random.default_rng(seed + 1)
+    kinds = rng.choice(len(NDJSON_CORRUPTIONS), size=len(df))
+    hours = rng.integers(0, 24, len(df))
+    invalid = df['_invalid'].to_numpy()
+    for i, row in enumerate(df.itertuples(index=False)):
+        rec = {
+            "resourceType": "Observation",
+            "id": row.sample_id,
+            "subject": {"reference": f"Patient/{row.birth_date}-{row.sex}-{row.municipality_code}"},
+            "effectiveDateTime": f"{row.exam_date}T{hours[i]:02d}:00:00Z",
+            "age": int(row.patient_age),
+            "sex": row.sex,
+            "hb": float(row.hemoglobin),
+            "ht": round(float(row.hemoglobin) * 3.0, 1),
+            "wbc": float(row.leukocytes),
+            "neutrophils_abs": float(row.neutrophils),
+            "lymphocytes_abs": float(row.lymphocytes),
+            "platelets": int(row.platelets),
+            "municipality_code": str(row.municipality_code),
+        }
+        if invalid[i]:
+            kind = NDJSON_CORRUPTIONS[kinds[i]]
+            if kind == 'json':
+                yield '{"id": "' + str(row.sample_id) + '", "hb": '
+                continue
+            if kind == 'hb':
+                rec["hb"] = 40.0
+            elif kind == 'sex':
+                rec["sex"] = 'X'
+            elif kind == 'date':
+                rec["effectiveDateTime"] = 'ontem'
+            else:
+                rec["platelets"] = 10
+        yield json.dumps(rec)
+
+def write_ndjson(df, path, seed=42):
+    with open(path, 'w', encoding='utf8') as fh:
+        for line in ndjson_lines(df, seed):
+            fh.write(line + '\n')
+    return path
+
+def add_generator_arguments(parser):
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--invalid-ratio', type=float, default=0.02)
+    parser.add_argument('--patient-repeat', type=float, default=3.0,
+                        help="exames por paciente, em média")
+    parser.add_argument('--municipalities', type=int, default=DEFAULT_MUNICIPALITIES)
+    parser.add_argument('--municipality-skew', type=float, default=1.0,
+                        help="expoente Zipf da distribuição por município (0 = uniforme)")
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+
+def generator_options(args):
+    return {
+        'rows': args.rows,
+        'invalid_ratio': args.invalid_ratio,
+        'patient_repeat': args.patient_repeat,
+        'municipalities': args.municipalities,
+        'municipality_skew': args.municipality_skew,
+        'days': args.days,
+        'seed': args.seed,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerador sintético de hemogramas (CSV ou NDJSON)")
+    parser.add_argument('destino')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    df = generate_hemograms(**generator_options(args))
+    if args.format == 'csv':
+        write_csv(df, args.destino)
+    else:
+        write_ndjson(df, args.destino, seed=args.seed)
+    print(f"{len(df)} linhas ({int(df['_invalid'].sum())} inválidas) em {args.destino}")
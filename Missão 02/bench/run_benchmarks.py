@@ -0,0 +1,251 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+if __package__:
+    from .generator import (add_generator_arguments, generate_hemograms, generator_options,
+                            municipality_codes, write_csv, write_ndjson)
+else:  # executado como script: python bench/run_benchmarks.py
+    from generator import (add_generator_arguments, generate_hemograms, generator_options,
+                           municipality_codes, write_csv, write_ndjson)
+
+from telemetry import peak_rss_mb
+
+logger = logging.getLogger('benchmarks')
+
+# Fora da árvore do repositório por padrão; --results-dir ou BENCH_RESULTS_DIR escolhem outro lugar
+RESULTS_DIR = os.environ.get('BENCH_RESULTS_DIR') or os.path.join(tempfile.gettempdir(), 'hemogram_bench_results')
+# Piora tolerada antes de acusar regressão (ruído de medição)
+DEFAULT_TOLERANCE = 0.15
+
+def percentiles(latencies_s):
+    values = np.array(latencies_s) * 1000.0
+    return {
+        'queries': len(values),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p95_ms': round(float(np.percentile(values, 95)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'max_ms': round(float(values.max()), 2),
+    }
+
+# Cada etapa roda num processo novo (spawn): o pico de memória medido é só dela.
+
+def stage_csv_processor(ctx):
+    from etl.etl import DataProcessor, iter_csv_chunks
+    processor = DataProcessor()
+    for _ in processor.process_chunks(iter_csv_chunks(ctx['csv_path'], ctx['chunk_size'])):
+        pass
+    return {'rows': processor.stats['processed'], 'valid': processor.stats['valid'],
+            'invalid': processor.stats['invalid']}
+
+def stage_ndjson_parse(ctx):
+    sys.path.append(os.path.join(ROOT, 'template', 'backend'))
+    import etl_ingest
+    rows = accepted = 0
+    with open(ctx['ndjson_path'], 'r', encoding='utf8') as fh:
+        for rows, payloads, _ in etl_ingest.iter_parsed(fh):
+            accepted += len(payloads)
+    return {'rows': rows, 'valid': accepted, 'invalid': rows - accepted}
+
+def stage_csv_load(ctx):
+    from etl.etl import run_hemogram_etl
+    from runtime import get_engine
+    report = run_hemogram_etl(ctx['csv_path'], ctx['chunk_size'], db_engine=get_engine(ctx['database_url']))
+    return {'rows': report['processed'], 'rows_loaded': report['rows_loaded']}
+
+def stage_alerts(ctx):
+    from alerts_engine.alerts_engine import AlertEngine
+    from runtime import get_engine
+    from sqlalchemy import text
+    engine = get_engine(ctx['database_url'])
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT count(*) FROM hemogram WHERE created_at >= now() - make_interval(days => :d)"),
+            {'d': ctx['days']}
+        ).scalar()
+    alerts = AlertEngine(engine).process_alerts(days_back=ctx['days'], backfill=True)
+    return {'rows': rows, 'alerts_generated': alerts}
+
+def stage_metrics(ctx):
+    from alerts_engine.alerts_engine import MetricsCalculator
+    from runtime import get_engine
+    calculator = MetricsCalculator(get_engine(ctx['database_url']))
+    rng = random.Random(ctx['seed'])
+    codes = municipality_codes(ctx['municipalities'])
+    latencies = []
+    for _ in range(ctx['queries']):
+        age_min = rng.choice([None, 0, 18, 40, 60])
+        age_range = (age_min, age_min + rng.choice([10, 20, 40])) if age_min is not None else None
+        municipality = rng.choice([None, None] + codes[:5])
+        started = time.perf_counter()
+        calculator.get_basic_metrics(age_range, municipality, ctx['days'])
+        latencies.append(time.perf_counter() - started)
+    heatmap = []
+    for _ in range(max(ctx['queries'] // 10, 1)):
+        started = time.perf_counter()
+        calculator.get_municipality_heatmap(ctx['days'])
+        heatmap.append(time.perf_counter() - started)
+    return {'rows': 0, **percentiles(latencies), 'heatmap': percentiles(heatmap)}
+
+def stage_ndjson_load(ctx):
+    sys.path.append(os.path.join(ROOT, 'template', 'backend'))
+    import etl_ingest
+    from etl.dead_letter import ErrorRateBreaker
+    from runtime import get_engine
+    report = etl_ingest.process_file(ctx['ndjson_path'], breaker=ErrorRateBreaker(None),
+                                     db_engine=get_engine(ctx['ndjson_database_url']))
+    return {'rows': report['lines'], 'valid': report['accepted'], 'invalid': report['errors']}
+
+# (nome, função, exige banco) na ordem de execução: a carga precede alertas e métricas
+STAGES = [
+    ('csv_processor', stage_csv_processor, None),
+    ('ndjson_parse', stage_ndjson_parse, None),
+    ('csv_load', stage_csv_load, 'database_url'),
+    ('alerts', stage_alerts, 'database_url'),
+    ('metrics', stage_metrics, 'database_url'),
+    ('ndjson_load', stage_ndjson_load, 'ndjson_database_url'),
+]
+
+def _run_stage(stage, ctx):
+    """Executado no processo filho: mede tempo e pico de memória da etapa"""
+    logging.disable(logging.WARNING)
+    started = time.perf_counter()
+    result = stage(ctx)
+    elapsed = time.perf_counter() - started
+    result['elapsed_s'] = round(elapsed, 3)
+    if result.get('rows'):
+        result['rows_per_s'] = round(result['rows'] / elapsed, 1)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(options, database_url=None, ndjson_database_url=None, chunk_size=50000,
+              queries=200, only=None, repeat=1):
+    """Gera os dados sintéticos e executa as etapas; etapas de banco sem URL são puladas.
+
+    Etapas sem banco rodam `repeat` vezes e fica a mais rápida (menos ruído).
+    """
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='hemogram_bench_') as workdir:
+        df = generate_hemograms(**options)
+        ctx = {
+            'csv_path': write_csv(df, os.path.join(workdir, 'hemograms.csv')),
+            'ndjson_path': write_ndjson(df, os.path.join(workdir, 'hemograms.ndjson'), seed=options['seed']),
+            'chunk_size': chunk_size,
+            'database_url': database_url,
+            'ndjson_database_url': ndjson_database_url,
+            'days': options['days'],
+            'seed': options['seed'],
+            'municipalities': options['municipalities'],
+            'queries': queries,
+        }
+        del df
+        stages = {}
+        for name, stage, requires in STAGES:
+            if only and name not in only:
+                continue
+            if requires and not ctx[requires]:
+                logger.info(f"{name}: pulada (sem {requires})")
+                continue
+            runs = []
+            for _ in range(1 if requires else repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(pool.submit(_run_stage, stage, ctx).result())
+            stages[name] = min(runs, key=lambda r: r['elapsed_s'])
+            # O resultado completo sai uma vez só, no JSON final
+            logger.info(f"{name}: concluída em {stages[name]['elapsed_s']}s")
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'generator': options,
+        'chunk_size': chunk_size,
+        'repeat': repeat,
+        'stages': stages,
+    }
+
+def save_results(results, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    stamp = results['created_at'].replace(':', '').replace('-', '')
+    path = os.path.join(directory, f"{stamp}-{results['git_commit'] or 'nogit'}.json")
+    with open(path, 'w', encoding='utf8') as fh:
+        json.dump(results, fh, indent=2)
+    return path
+
+def compare_results(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compara com um resultado anterior: devolve (linhas da comparação, regressões)"""
+    # Métrica -> True quando maior é melhor
+    metrics = (('rows_per_s', True), ('p50_ms', False), ('p95_ms', False), ('peak_rss_mb', False))
+    lines = []
+    regressions = []
+    for name, stage in current['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if not before:
+            continue
+        for metric, higher_is_better in metrics:
+            if metric not in stage or not before.get(metric):
+                continue
+            change = (stage[metric] - before[metric]) / before[metric]
+            worse = -change if higher_is_better else change
+            flag = 'REGRESSÃO' if worse > tolerance else ''
+            lines.append(f"{name:<14} {metric:<12} {before[metric]:>12} -> {stage[metric]:>12} "
+                         f"({change:+.1%}) {flag}")
+            if flag:
+                regressions.append((name, metric, before[metric], stage[metric]))
+    if current.get('generator') != baseline.get('generator'):
+        lines.append("Atenção: parâmetros do gerador diferentes do baseline")
+    return lines, regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do ETL, motor de alertas e métricas")
+    add_generator_arguments(parser)
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help="Postgres com sql/hemograma.sql (etapas csv_load, alerts e metrics)")
+    parser.add_argument('--ndjson-database-url', default=os.environ.get('BENCH_NDJSON_DATABASE_URL'),
+                        help="Postgres com template/database/schema.sql (etapa ndjson_load)")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200, help="consultas na etapa metrics")
+    parser.add_argument('--repeat', type=int, default=3, help="execuções das etapas sem banco")
+    parser.add_argument('--only', nargs='*', help="etapas a executar (padrão: todas)")
+    parser.add_argument('--baseline', help="resultado anterior (JSON) para comparação")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--results-dir', default=RESULTS_DIR,
+                        help=f"diretório dos resultados JSON (padrão: {RESULTS_DIR})")
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = run_suite(generator_options(args), args.database_url, args.ndjson_database_url,
+                        args.chunk_size, args.queries, args.only, args.repeat)
+    if not args.no_save:
+        print(f"Resultados gravados em {save_results(results, args.results_dir)}")
+    print(json.dumps(results['stages'], indent=2))
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as fh:
+            lines, regressions = compare_results(results, json.load(fh), args.tolerance)
+        print("\n".join(lines))
+        if regressions:
+            sys.exit(1)
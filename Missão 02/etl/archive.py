@@ -0,0 +1,126 @@
+import hashlib
+import os
+from datetime import date
+
+# Diretório do arquivo Parquet; vazio desativa (o ETL grava só no Postgres)
+ARCHIVE_DIR = os.environ.get('HEMOGRAM_ARCHIVE_DIR', '')
+
+# Partições hive: exam_month=AAAA-MM/municipality_code=NNNNNNN
+PARTITION_COLUMNS = ('exam_month', 'municipality_code')
+
+def require_pyarrow():
+    """pyarrow é dependência opcional: só o arquivo Parquet precisa dele"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+    except ImportError as e:
+        raise RuntimeError("O arquivo Parquet requer pyarrow (pip install pyarrow)") from e
+    return pyarrow, pyarrow.compute, pyarrow.dataset
+
+def _arrow_type(pa, alias):
+    if alias == 'timestamp':
+        return pa.timestamp('us', tz='UTC')
+    return pa.type_for_alias(alias)
+
+class ParquetArchive:
+    """Cópia colunar dos hemogramas validados, para análises de longo prazo fora do Postgres.
+
+    `columns` são pares (coluna, tipo do pyarrow: 'string', 'double', 'int64',
+    'date32' ou 'timestamp' em UTC) e `date_column` define o mês da partição;
+    sem data vale a de hoje, como na carga. O nome dos arquivos vem da origem e
+    da posição do lote nela: reprocessar ou retomar um arquivo (com o mesmo
+    tamanho de bloco) sobrescreve os mesmos arquivos em vez de duplicar linhas.
+    Reenvios de um sample_id em outro arquivo aparecem duas vezes.
+    """
+
+    def __init__(self, root, columns, date_column):
+        self.root = root
+        self.columns = tuple(columns)
+        self.date_column = date_column
+
+    def _partitioning(self, pa, pads):
+        return pads.partitioning(pa.schema([(c, pa.string()) for c in PARTITION_COLUMNS]), flavor='hive')
+
+    def _array(self, pa, pc, values, alias, length):
+        target = _arrow_type(pa, alias)
+        if values is None:
+            return pa.nulls(length, target)
+        try:
+            array = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Coluna object com tipos misturados (ex.: '41' e 41.0): normaliza como texto
+            array = pa.array([None if v is None or v != v else str(v) for v in values], pa.string())
+        if array.type == target:
+            return array
+        if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            # Datas inválidas viram nulas (a carga no Postgres rejeitaria o lote inteiro)
+            if alias == 'date32':
+                parsed = pc.strptime(array, format='%Y-%m-%d', unit='s', error_is_null=True)
+                return parsed.cast(target)
+            if alias in ('int64', 'double'):
+                array = array.cast(pa.float64())
+        return array.cast(target, safe=False)
+
+    def to_table(self, data):
+        """Tabela do pyarrow a partir de um DataFrame ou de {coluna: valores}"""
+        pa, pc, _ = require_pyarrow()
+        length = len(data)
+        if isinstance(data, dict):
+            length = len(next(iter(data.values()), ()))
+        arrays = [
+            self._array(pa, pc, data[name] if name in data else None, alias, length)
+            for name, alias in self.columns
+        ]
+        table = pa.table(arrays, names=[name for name, _ in self.columns])
+        today = pa.scalar(date.today(), pa.date32())
+        day = table[self.date_column]
+        if pa.types.is_timestamp(day.type):
+            day = pc.fill_null(day.cast(pa.date32()), today)
+        else:
+            day = pc.fill_null(day, today)
+            table = table.set_column(table.schema.get_field_index(self.date_column), self.date_column, day)
+        return table.append_column('exam_month', pc.strftime(day, format='%Y-%m'))
+
+    def write(self, data, source, position):
+        """Grava um lote (DataFrame ou {coluna: valores}); devolve o número de linhas"""
+        pa, pc, pads = require_pyarrow()
+        table = self.to_table(data)
+        if not table.num_rows:
+            return 0
+        table = table.sort_by([(c, 'ascending') for c in PARTITION_COLUMNS])
+        stem = os.path.splitext(os.path.basename(source))[0]
+        token = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:8]
+        pads.write_dataset(
+            table, self.root, format='parquet',
+            partitioning=self._partitioning(pa, pads),
+            basename_template=f"{stem}-{token}-{position:010d}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            # Sem threads a numeração {i} dos arquivos é determinística
+            use_threads=False,
+            max_partitions=1 << 16,
+        )
+        return table.num_rows
+
+    def scan(self, columns, since=None, municipality_code=None, predicate=None):
+        """Lê só as colunas pedidas das partições dentro do filtro.
+
+        `since` (date) e `municipality_code` podam diretórios pela partição;
+        `since` e `predicate` (expressão de pyarrow.dataset) ainda descartam
+        row groups pelas estatísticas do Parquet.
+        """
+        pa, _, pads = require_pyarrow()
+        if not os.path.isdir(self.root):
+            return pa.table({c: pa.array([], _arrow_type(pa, dict(self.columns).get(c, 'string')))
+                             for c in columns})
+        dataset = pads.dataset(self.root, format='parquet', partitioning=self._partitioning(pa, pads))
+        condition = predicate
+        if since is not None:
+            date_type = _arrow_type(pa, dict(self.columns)[self.date_column])
+            since_filter = ((pads.field('exam_month') >= since.strftime('%Y-%m'))
+                            & (pads.field(self.date_column) >= pa.scalar(since, pa.date32()).cast(date_type)))
+            condition = since_filter if condition is None else condition & since_filter
+        if municipality_code:
+            municipality_filter = pads.field('municipality_code') == str(municipality_code)
+            condition = municipality_filter if condition is None else condition & municipality_filter
+        return dataset.to_table(columns=list(columns), filter=condition)
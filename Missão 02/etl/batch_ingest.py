@@ -0,0 +1,172 @@
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+logger = logging.getLogger('batch_ingest')
+
+MANIFEST_NAME = '.ingest_manifest.json'
+CHECKPOINT_DIR = '.ingest_checkpoints'
+
+def file_checksum(path, block_size=1 << 20):
+    """SHA-256 do conteúdo do arquivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf8') as fh:
+        json.dump(data, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+class FileCheckpoint:
+    """Progresso de um arquivo (linhas concluídas), gravado só pelo worker que o processa"""
+
+    def __init__(self, path):
+        self.path = path
+        self.position = 0
+        if os.path.exists(path):
+            with open(path, encoding='utf8') as fh:
+                self.position = json.load(fh).get('position', 0)
+
+    def save(self, position):
+        self.position = position
+        _write_json_atomic(self.path, {'position': position, 'updated_at': datetime.now().isoformat()})
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class IngestManifest:
+    """Status e checksum de cada arquivo do diretório; só o processo principal escreve"""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.checkpoint_dir = os.path.join(directory, CHECKPOINT_DIR)
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf8') as fh:
+                self.files = json.load(fh)
+
+    def checkpoint_path(self, checksum):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        return os.path.join(self.checkpoint_dir, f"{checksum}.json")
+
+    def is_done(self, name, checksum):
+        entry = self.files.get(name)
+        return bool(entry) and entry.get('status') == 'done' and entry.get('checksum') == checksum
+
+    def update(self, name, **fields):
+        self.files.setdefault(name, {}).update(fields, updated_at=datetime.now().isoformat())
+        _write_json_atomic(self.path, self.files)
+
+def _run_file(ingest_fn, path, checkpoint_path):
+    """Executado dentro do worker: processa um arquivo a partir do checkpoint"""
+    checkpoint = FileCheckpoint(checkpoint_path)
+    resumed_from = checkpoint.position
+    started = time.perf_counter()
+    try:
+        report = ingest_fn(path, checkpoint)
+        status, error = 'done', None
+        checkpoint.clear()
+    except Exception as e:
+        logging.getLogger('batch_ingest').exception(f"Falha ao processar {path}: {e}")
+        report, status, error = {}, 'failed', str(e)
+    return {
+        'path': path,
+        'status': status,
+        'error': error,
+        'report': report,
+        'resumed_from': resumed_from,
+        'position': checkpoint.position,
+        'worker_pid': os.getpid(),
+        'busy_s': time.perf_counter() - started
+    }
+
+def ingest_directory(directory, ingest_fn, pattern='*.csv', workers=None, rows_key='processed'):
+    """Distribui os arquivos do diretório entre um pool de processos.
+
+    `ingest_fn(path, checkpoint)` precisa ser uma função de módulo (picklable);
+    deve retomar de `checkpoint.position` e chamar `checkpoint.save()` a cada
+    bloco gravado. Cada worker é um processo novo (spawn) e portanto abre seu
+    próprio pool de conexões. Arquivos já concluídos com o mesmo checksum são
+    pulados; arquivos parciais retomam do último checkpoint.
+    """
+    workers = workers or os.cpu_count() or 1
+    manifest = IngestManifest(directory)
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+
+    tasks = []
+    skipped = 0
+    for path in paths:
+        name = os.path.basename(path)
+        checksum = file_checksum(path)
+        if manifest.is_done(name, checksum):
+            skipped += 1
+            continue
+        previous = manifest.files.get(name, {})
+        checkpoint_path = manifest.checkpoint_path(checksum)
+        if previous.get('checksum') not in (None, checksum):
+            # Conteúdo mudou: o checkpoint antigo não vale mais
+            FileCheckpoint(manifest.checkpoint_path(previous['checksum'])).clear()
+        manifest.update(name, status='pending', checksum=checksum)
+        tasks.append((name, path, checkpoint_path))
+
+    logger.info(f"{len(tasks)} arquivo(s) para processar, {skipped} já concluído(s), {workers} worker(s)")
+    started = time.perf_counter()
+    results = []
+    if tasks:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context) as pool:
+            futures = {}
+            for name, path, checkpoint_path in tasks:
+                manifest.update(name, status='running')
+                futures[pool.submit(_run_file, ingest_fn, path, checkpoint_path)] = name
+            for future in as_completed(futures):
+                name = futures[future]
+                result = future.result()
+                results.append(result)
+                manifest.update(
+                    name,
+                    status=result['status'],
+                    error=result['error'],
+                    rows=result['report'].get(rows_key),
+                    position=result['position'],
+                    worker_pid=result['worker_pid'],
+                    busy_s=round(result['busy_s'], 3)
+                )
+                logger.info(f"{name}: {result['status']} ({result['busy_s']:.1f}s)")
+
+    report = throughput_report(results, time.perf_counter() - started, workers, rows_key)
+    report['skipped_files'] = skipped
+    logger.info(f"Ingestão do diretório concluída: {report}")
+    return report
+
+def throughput_report(results, wall_s, workers, rows_key='processed'):
+    """Vazão agregada: linhas/s, arquivos/s e utilização de cada worker"""
+    rows = sum(r['report'].get(rows_key) or 0 for r in results)
+    busy_by_worker = {}
+    for r in results:
+        busy_by_worker[r['worker_pid']] = busy_by_worker.get(r['worker_pid'], 0.0) + r['busy_s']
+    return {
+        'files': len(results),
+        'files_done': sum(1 for r in results if r['status'] == 'done'),
+        'files_failed': sum(1 for r in results if r['status'] == 'failed'),
+        'rows': rows,
+        'wall_s': round(wall_s, 3),
+        'rows_per_s': round(rows / wall_s, 1) if wall_s else None,
+        'files_per_s': round(len(results) / wall_s, 3) if wall_s else None,
+        'workers': workers,
+        'worker_utilisation': {
+            str(pid): round(busy / wall_s, 3) if wall_s else None
+            for pid, busy in busy_by_worker.items()
+        }
+    }
@@ -0,0 +1,212 @@
+import csv
+import io
+import logging
+import sys
+import time
+import uuid
+from telemetry import REGISTRY
+
+logger = logging.getLogger('bulk_loader')
+
+# Marcador de NULL usado no COPY (formato CSV)
+COPY_NULL = '\\N'
+
+def is_dataframe(obj):
+    """Sem importar o pandas: se ele não foi carregado, `obj` não pode ser um DataFrame
+    (o ingest NDJSON usa só listas de dicts e não paga o import)"""
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(obj, pd.DataFrame)
+
+# Erros do DB-API (psycopg2 ou embrulhados pelo SQLAlchemy) causados pelo conteúdo do
+# lote: valor que não cabe na coluna, data inválida, violação de constraint
+DATA_ERROR_NAMES = ('DataError', 'IntegrityError')
+
+def is_data_error(exc):
+    """True se a carga falhou pelos dados do lote e não pelo banco (conexão, lock, timeout).
+
+    Compara pelo nome das classes para não importar o driver nem o SQLAlchemy.
+    """
+    if isinstance(exc, (ValueError, TypeError)):
+        return True
+    for error in (exc, getattr(exc, 'orig', None)):
+        if error is not None and any(cls.__name__ in DATA_ERROR_NAMES for cls in type(error).__mro__):
+            return True
+    return False
+
+# O SQLAlchemy é importado nos métodos: quem só importa o módulo (CLI --help) não paga o custo
+
+class BulkLoader:
+    """Carga em lote: COPY para tabela de staging UNLOGGED + um upsert set-based por lote.
+
+    Reproduz a semântica de executar `INSERT ... ON CONFLICT (key)` linha a linha:
+    dentro de um lote, a primeira ocorrência de cada chave define as colunas
+    inseridas e a última define as colunas de `update_columns`. Sem
+    `update_columns` o conflito vira DO NOTHING (primeira ocorrência vence).
+
+    Em tabelas particionadas a unicidade inclui a chave de partição:
+    `conflict_key` é o alvo do ON CONFLICT (padrão: `key`) e `partitions`
+    (etl.partitions.MonthlyPartitions) cria as partições dos meses do lote.
+    Com `partitions.key_table`, cada `key` é levada à partição em que já está
+    antes do merge, e `conflict_key` (key + coluna de partição) equivale a `key`.
+    """
+
+    def __init__(self, db_engine, table, columns, key='sample_id', update_columns=(),
+                 extra_updates=None, batch_size=10000, staging_table=None, conflict_key=None,
+                 partitions=None):
+        self.engine = db_engine
+        self.table = table
+        self.columns = list(columns)
+        self.key = key
+        self.conflict_key = conflict_key or key
+        self.partitions = partitions
+        self.update_columns = list(update_columns)
+        self.extra_updates = extra_updates or {}
+        self.batch_size = batch_size
+        self.staging_table = staging_table or f"{table}_staging"
+        self._staging_ready = False
+
+    def dedupe(self, records):
+        """Colapsa chaves repetidas no lote como upserts sequenciais fariam"""
+        merged = {}
+        for rec in records:
+            current = merged.get(rec.get(self.key))
+            if current is None:
+                merged[rec.get(self.key)] = dict(rec)
+            else:
+                current.update((c, rec.get(c)) for c in self.update_columns)
+        return list(merged.values())
+
+    def dedupe_frame(self, df):
+        """Versão colunar de dedupe() para DataFrames"""
+        if not df[self.key].duplicated().any():
+            return df
+        first = df.drop_duplicates(self.key, keep='first').set_index(self.key)
+        if self.update_columns:
+            last = df.drop_duplicates(self.key, keep='last').set_index(self.key)
+            first[self.update_columns] = last.loc[first.index, self.update_columns]
+        return first.reset_index()
+
+    def ensure_staging(self):
+        """Cria a tabela de staging (mesmos tipos da tabela final, sem constraints)"""
+        if self._staging_ready:
+            return
+        from sqlalchemy import text
+        from sqlalchemy.exc import SQLAlchemyError
+        cols = ', '.join(self.columns)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(f"""
+                    CREATE UNLOGGED TABLE IF NOT EXISTS {self.staging_table} AS
+                    SELECT NULL::text AS load_id, {cols} FROM {self.table} WITH NO DATA
+                """))
+        except SQLAlchemyError as e:
+            # Outro processo pode ter criado a tabela ao mesmo tempo
+            logger.debug(f"Staging {self.staging_table} já existente: {e}")
+        self._staging_ready = True
+
+    def _copy(self, conn, load_id, rows):
+        """Envia o lote (dicts ou DataFrame) para a staging via COPY (fallback: executemany)"""
+        cols = ['load_id'] + self.columns
+        dbapi_conn = conn.connection
+        cursor = dbapi_conn.cursor()
+        try:
+            if hasattr(cursor, 'copy_expert'):
+                buf = io.StringIO()
+                if is_dataframe(rows):
+                    frame = rows.reindex(columns=self.columns)
+                    frame.insert(0, 'load_id', load_id)
+                    frame.to_csv(buf, header=False, index=False, na_rep=COPY_NULL)
+                else:
+                    writer = csv.writer(buf)
+                    for rec in rows:
+                        writer.writerow([load_id] + [
+                            COPY_NULL if rec.get(c) is None else rec.get(c) for c in self.columns
+                        ])
+                buf.seek(0)
+                started = time.perf_counter()
+                cursor.copy_expert(
+                    f"COPY {self.staging_table} ({', '.join(cols)}) "
+                    f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                    buf
+                )
+                # COPY pelo cursor bruto não dispara os eventos do SQLAlchemy
+                REGISTRY.count('db_round_trips', stage=REGISTRY.current_stage)
+                REGISTRY.observe('db_seconds', time.perf_counter() - started, stage=REGISTRY.current_stage)
+                return
+        finally:
+            cursor.close()
+
+        if is_dataframe(rows):
+            rows = dataframe_records(rows, self.columns)
+        from sqlalchemy import text
+        placeholders = ', '.join(f":{c}" for c in cols)
+        conn.execute(
+            text(f"INSERT INTO {self.staging_table} ({', '.join(cols)}) VALUES ({placeholders})"),
+            [{'load_id': load_id, **{c: rec.get(c) for c in self.columns}} for rec in rows]
+        )
+
+    def _merge_sql(self):
+        cols = ', '.join(self.columns)
+        updates = [f"{c} = EXCLUDED.{c}" for c in self.update_columns]
+        updates += [f"{c} = {expr}" for c, expr in self.extra_updates.items()]
+        if updates:
+            conflict = f"DO UPDATE SET {', '.join(updates)}"
+        else:
+            conflict = "DO NOTHING"
+        return f"""
+            WITH batch AS (
+                DELETE FROM {self.staging_table} WHERE load_id = :load_id
+                RETURNING {cols}
+            )
+            INSERT INTO {self.table} ({cols})
+            SELECT {cols} FROM batch
+            ON CONFLICT ({self.conflict_key}) {conflict}
+        """
+
+    def load_batch(self, records):
+        """Carrega um lote numa única transação; devolve linhas inseridas/atualizadas"""
+        if is_dataframe(records):
+            rows = self.dedupe_frame(records)
+        else:
+            rows = self.dedupe(records)
+        if len(rows) == 0:
+            return 0
+        self.ensure_staging()
+        from sqlalchemy import text
+        load_id = uuid.uuid4().hex
+        try:
+            with self.engine.begin() as conn:
+                self._copy(conn, load_id, rows)
+                if self.partitions is not None:
+                    self.partitions.route_staging(conn, self.staging_table, load_id)
+                    self.partitions.ensure_for_staging(conn, self.staging_table, load_id)
+                result = conn.execute(text(self._merge_sql()), {'load_id': load_id})
+        except Exception:
+            if self.partitions is not None:
+                self.partitions.forget()
+            raise
+        return result.rowcount
+
+    def load(self, records):
+        """Carrega registros (lista de dicts ou DataFrame) em lotes de batch_size"""
+        if is_dataframe(records):
+            return sum(
+                self.load_batch(records.iloc[start:start + self.batch_size])
+                for start in range(0, len(records), self.batch_size)
+            )
+        total = 0
+        batch = []
+        for rec in records:
+            batch.append(rec)
+            if len(batch) >= self.batch_size:
+                total += self.load_batch(batch)
+                batch = []
+        if batch:
+            total += self.load_batch(batch)
+        return total
+
+def dataframe_records(df, columns):
+    """Converte as colunas do DataFrame em dicts com None no lugar de NaN/NA"""
+    present = [c for c in columns if c in df.columns]
+    subset = df[present].astype(object)
+    return subset.where(subset.notna(), None).to_dict('records')
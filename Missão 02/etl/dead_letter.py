@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+
+from telemetry import REGISTRY
+
+logger = logging.getLogger('dead_letter')
+
+def dead_letter_table():
+    """Tabela dead_letter do insert em lote; o sqlalchemy só é importado no primeiro flush"""
+    from sqlalchemy import column, table
+    from sqlalchemy.dialects.postgresql import JSONB
+    return table(
+        'dead_letter',
+        column('source_file'),
+        column('line_no'),
+        column('error'),
+        column('raw', JSONB),
+    )
+
+def _reject_constant(name):
+    raise ValueError(f"{name} não é JSON válido para o Postgres")
+
+def raw_json(raw):
+    """Valor para a coluna JSONB: o registro original ou, se não for JSON válido, o texto"""
+    if isinstance(raw, (dict, list)):
+        return raw
+    text = (raw or '').rstrip('\r\n')
+    try:
+        return json.loads(text, parse_constant=_reject_constant)
+    except ValueError:
+        return text
+
+def error_text(error):
+    if isinstance(error, str):
+        return error
+    return json.dumps(error, ensure_ascii=False, default=str)
+
+class ErrorRateExceeded(Exception):
+    """Taxa de rejeição acima do limite: o arquivo é abortado"""
+
+class ErrorRateBreaker:
+    """Disjuntor por arquivo: aborta quando errors/linhas passa de `max_rate`.
+
+    Só avalia depois de `min_lines` linhas, para que poucos erros no início
+    do arquivo não derrubem a execução.
+    """
+
+    def __init__(self, max_rate=0.5, min_lines=1000):
+        self.max_rate = max_rate
+        self.min_lines = min_lines
+
+    def check(self, lines, errors):
+        if self.max_rate is None or lines < self.min_lines:
+            return
+        rate = errors / lines
+        if rate > self.max_rate:
+            raise ErrorRateExceeded(
+                f"Taxa de erro {rate:.1%} em {lines} linhas excede o limite de {self.max_rate:.1%}"
+            )
+
+class DeadLetterSink:
+    """Registros rejeitados gravados em lotes à medida que aparecem.
+
+    Com `db_engine`, grava na tabela dead_letter; sem ele, acrescenta linhas
+    NDJSON em `path`. O buffer nunca passa de `buffer_size` registros, então
+    a memória não cresce com o número de erros do arquivo.
+    """
+
+    def __init__(self, source_file, db_engine=None, path=None, buffer_size=500):
+        if db_engine is None and path is None:
+            raise ValueError("Informe db_engine ou path")
+        self.source_file = source_file
+        self.engine = db_engine
+        self.path = path
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._buffer = []
+
+    def add(self, line_no, error, raw):
+        self._buffer.append({
+            'source_file': self.source_file,
+            'line_no': line_no,
+            'error': error_text(error),
+            'raw': raw_json(raw),
+        })
+        self.count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, errors):
+        """Recebe erros no formato {"line", "error", "raw"} do etl_ingest"""
+        for e in errors:
+            self.add(e['line'], e['error'], e['raw'])
+
+    def flush(self):
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        with REGISTRY.stage('dead_letter.flush'):
+            if self.engine is not None:
+                from sqlalchemy import insert
+                with self.engine.begin() as conn:
+                    conn.execute(insert(dead_letter_table()), rows)
+            else:
+                with open(self.path, 'a', encoding='utf8') as fh:
+                    fh.writelines(json.dumps(r, ensure_ascii=False) + '\n' for r in rows)
+        REGISTRY.count('dead_letter_rows', len(rows))
+        return len(rows)
+
+    def close(self):
+        self.flush()
+        if self.count:
+            target = 'dead_letter' if self.engine is not None else self.path
+            logger.info(f"{self.count} registro(s) rejeitado(s) de {self.source_file} em {target}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,176 @@
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger('ingest_jobs')
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+def count_data_rows(path, block_size=1 << 20):
+    """Linhas de dados de um CSV (sem o cabeçalho), contadas em blocos de bytes"""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+class IngestJob:
+    """Um arquivo enviado e o andamento da sua ingestão"""
+
+    def __init__(self, path, filename):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.filename = filename
+        self.status = QUEUED
+        self.submitted_at = utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.total_rows = None
+        self.rows_done = 0
+        self.stats = {}
+        self.result = {}
+        self.error = None
+        self._started = None
+        self._elapsed = None
+
+    def start(self):
+        self.status = RUNNING
+        self.started_at = utcnow()
+        self._started = time.perf_counter()
+
+    def progress(self, rows_done):
+        """Callback por bloco do ETL (on_chunk)"""
+        self.rows_done = rows_done
+
+    def finish(self, error=None):
+        self.status = FAILED if error else DONE
+        self.error = error
+        self.finished_at = utcnow()
+        if self._started is not None:
+            self._elapsed = time.perf_counter() - self._started
+
+    def to_dict(self):
+        elapsed = self._elapsed
+        if elapsed is None and self._started is not None:
+            elapsed = time.perf_counter() - self._started
+        rows_per_s = round(self.rows_done / elapsed, 1) if elapsed else None
+        eta_s = None
+        if self.status == RUNNING and rows_per_s and self.total_rows is not None:
+            eta_s = round(max(self.total_rows - self.rows_done, 0) / rows_per_s, 1)
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'submitted_at': self.submitted_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'total_rows': self.total_rows,
+            'rows_done': self.rows_done,
+            'valid': self.stats.get('valid', 0),
+            'invalid': self.stats.get('invalid', 0),
+            'errors': self.stats.get('errors', 0),
+            'elapsed_s': round(elapsed, 3) if elapsed is not None else None,
+            'rows_per_s': rows_per_s,
+            'eta_s': eta_s,
+            'result': self.result,
+            'error': self.error
+        }
+
+class QueueFull(Exception):
+    """Fila de ingestão cheia: o cliente deve tentar novamente mais tarde"""
+
+class IngestJobQueue:
+    """Fila limitada de uploads processados por threads em segundo plano.
+
+    `handler(job)` executa a ingestão de um job e pode preencher job.stats
+    (referência viva para o DataProcessor.stats) e job.result. Com a fila
+    cheia, submit() recusa o arquivo (backpressure) em vez de acumular
+    uploads em disco. Os jobs concluídos ficam consultáveis até o limite
+    `keep_finished`.
+    """
+
+    def __init__(self, handler, workers=2, max_pending=8, spool_dir=None, keep_finished=200):
+        self.handler = handler
+        self.workers = workers
+        self.spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), 'hemogram_uploads')
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'ingest-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, stream, filename):
+        """Grava o upload no spool e enfileira; levanta QueueFull se não houver vaga"""
+        if self._queue.full():
+            raise QueueFull()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.csv', dir=self.spool_dir)
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        job = IngestJob(path, filename)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            os.remove(path)
+            raise QueueFull()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._ensure_workers()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (DONE, FAILED)]
+        for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.start()
+                job.total_rows = count_data_rows(job.path)
+                self.handler(job)
+                job.finish()
+            except Exception as e:
+                logger.error(f"Job {job.id} ({job.filename}) falhou: {e}")
+                job.finish(str(e))
+            finally:
+                if os.path.exists(job.path):
+                    os.remove(job.path)
+                self._queue.task_done()
+            logger.info(f"Job {job.id} concluído: {job.to_dict()}")
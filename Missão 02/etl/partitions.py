@@ -0,0 +1,197 @@
+import argparse
+import logging
+import os
+import re
+import sys
+from datetime import date
+
+logger = logging.getLogger('partitions')
+
+# Partições retidas por padrão na retenção (mês corrente incluído)
+DEFAULT_KEEP_MONTHS = int(os.environ.get('HEMOGRAM_RETENTION_MONTHS', 24))
+
+# sample_id -> chave de partição, nos dois schemas (sql/hemograma.sql e template)
+SAMPLE_KEY_TABLE = 'hemogram_sample_key'
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+class MonthlyPartitions:
+    """Partições mensais de uma tabela particionada por RANGE numa coluna de data/hora.
+
+    As partições se chamam <tabela>_AAAA_MM e são criadas sob demanda pela
+    carga (ensure_for_staging) dentro da transação do lote. Com
+    `timestamptz=True` os limites dos meses são em UTC.
+
+    A unicidade de uma tabela particionada inclui a chave de partição, então
+    `key_table` (tabela comum com `key` PRIMARY KEY e a coluna de partição)
+    mantém `key` única entre partições: route_staging() manda cada chave já
+    conhecida para a data já gravada dela.
+    """
+
+    def __init__(self, table, column, timestamptz=False, key_table=None, key='sample_id'):
+        self.table = table
+        self.column = column
+        self.timestamptz = timestamptz
+        self.key_table = key_table
+        self.key = key
+        self._known = set()
+        self._name_re = re.compile(rf"^{re.escape(table)}_(\d{{4}})_(\d{{2}})$")
+
+    def partition_name(self, month):
+        return f"{self.table}_{month.year:04d}_{month.month:02d}"
+
+    def _bound(self, month):
+        if self.timestamptz:
+            return f"'{month.isoformat()} 00:00:00+00'"
+        return f"'{month.isoformat()}'"
+
+    def _month_expr(self):
+        column = f"{self.column} AT TIME ZONE 'UTC'" if self.timestamptz else self.column
+        return f"date_trunc('month', {column})::date"
+
+    def ensure(self, conn, months):
+        """Cria as partições que faltam; já existentes (ou já vistas) não custam DDL.
+
+        A criação trava a tabela-mãe até o fim da transação, então só acontece
+        no primeiro lote de cada mês novo. O advisory lock serializa cargas
+        concorrentes que tentem criar a mesma partição.
+        """
+        from sqlalchemy import text
+        missing = sorted({month_start(m) for m in months} - self._known)
+        if not missing:
+            return []
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                     {'key': f"partitions:{self.table}"})
+        existing = self.existing(conn)
+        created = []
+        for month in missing:
+            if month not in existing:
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {self.partition_name(month)} PARTITION OF {self.table} "
+                    f"FOR VALUES FROM ({self._bound(month)}) TO ({self._bound(add_months(month, 1))})"
+                ))
+                created.append(month)
+            self._known.add(month)
+        if created:
+            logger.info(f"Partições criadas em {self.table}: {[self.partition_name(m) for m in created]}")
+        return created
+
+    def route_staging(self, conn, staging_table, load_id):
+        """Registra as chaves novas do lote em `key_table` e, nas já registradas,
+        troca a coluna de partição da staging pela gravada (reenvio sem data ou
+        com data corrigida atualiza a linha existente em vez de duplicar).
+
+        Chaves repetidas na staging já foram colapsadas pelo BulkLoader. Cargas
+        concorrentes da mesma chave nova esperam o INSERT uma da outra.
+        Devolve o número de linhas da staging redirecionadas.
+        """
+        if not self.key_table:
+            return 0
+        from sqlalchemy import text
+        key, column = self.key, self.column
+        conn.execute(
+            text(f"INSERT INTO {self.key_table} ({key}, {column}) "
+                 f"SELECT {key}, {column} FROM {staging_table} WHERE load_id = :load_id "
+                 f"ON CONFLICT ({key}) DO NOTHING"),
+            {'load_id': load_id}
+        )
+        return conn.execute(
+            text(f"UPDATE {staging_table} s SET {column} = k.{column} FROM {self.key_table} k "
+                 f"WHERE s.load_id = :load_id AND k.{key} = s.{key} "
+                 f"AND s.{column} IS DISTINCT FROM k.{column}"),
+            {'load_id': load_id}
+        ).rowcount
+
+    def ensure_for_staging(self, conn, staging_table, load_id):
+        """Garante as partições dos meses presentes num lote já copiado para a staging"""
+        from sqlalchemy import text
+        months = conn.execute(
+            text(f"SELECT DISTINCT {self._month_expr()} FROM {staging_table} "
+                 f"WHERE load_id = :load_id AND {self.column} IS NOT NULL"),
+            {'load_id': load_id}
+        ).scalars().all()
+        return self.ensure(conn, months)
+
+    def forget(self):
+        """Descarta o cache (a transação que criaria as partições pode ter falhado)"""
+        self._known.clear()
+
+    def existing(self, conn):
+        """Meses com partição anexada (pelo nome <tabela>_AAAA_MM)"""
+        from sqlalchemy import text
+        names = conn.execute(text("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+        """), {'table': self.table}).scalars().all()
+        months = set()
+        for name in names:
+            match = self._name_re.match(name)
+            if match:
+                months.add(date(int(match.group(1)), int(match.group(2)), 1))
+        return months
+
+    def detach_older_than(self, conn, keep_months=DEFAULT_KEEP_MONTHS, today=None, drop=False,
+                          dry_run=False):
+        """Retenção: desanexa (ou apaga, com `drop`) as partições além dos últimos `keep_months` meses.
+
+        DETACH é só catálogo: a tabela desanexada continua existindo para
+        arquivamento. O rollup diário não é alterado, então os painéis
+        mantêm o histórico agregado.
+        """
+        from sqlalchemy import text
+        cutoff = add_months(month_start(today or date.today()), -(keep_months - 1))
+        expired = sorted(m for m in self.existing(conn) if m < cutoff)
+        for month in expired:
+            name = self.partition_name(month)
+            if dry_run:
+                logger.info(f"[dry-run] {name} seria {'apagada' if drop else 'desanexada'}")
+                continue
+            conn.execute(text(f"ALTER TABLE {self.table} DETACH PARTITION {name}"))
+            if self.key_table:
+                # Reenvio de uma amostra do mês removido volta a valer a data que vier
+                conn.execute(text(
+                    f"DELETE FROM {self.key_table} WHERE {self.column} >= {self._bound(month)} "
+                    f"AND {self.column} < {self._bound(add_months(month, 1))}"
+                ))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+            self._known.discard(month)
+            logger.info(f"{name} {'apagada' if drop else 'desanexada'} de {self.table}")
+        return [self.partition_name(m) for m in expired]
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from runtime import get_engine
+
+    parser = argparse.ArgumentParser(description="Partições mensais de hemogram: criação e retenção")
+    parser.add_argument('--table', default='hemogram')
+    parser.add_argument('--column', default='exam_date',
+                        help="chave de partição (collected_at no schema do template)")
+    parser.add_argument('--timestamptz', action='store_true',
+                        help="chave é timestamp with time zone (limites em UTC)")
+    parser.add_argument('--key-table', default=SAMPLE_KEY_TABLE,
+                        help="tabela de unicidade de sample_id, limpa junto com as partições removidas")
+    parser.add_argument('--ensure-months', type=int, default=0,
+                        help="cria antecipadamente as partições do mês corrente e dos N seguintes")
+    parser.add_argument('--keep-months', type=int, help="desanexa partições mais antigas que N meses")
+    parser.add_argument('--drop', action='store_true', help="apaga as partições desanexadas")
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    partitions = MonthlyPartitions(args.table, args.column, timestamptz=args.timestamptz,
+                                   key_table=args.key_table or None)
+    with get_engine().begin() as conn:
+        if args.ensure_months:
+            current = month_start(date.today())
+            partitions.ensure(conn, [add_months(current, i) for i in range(args.ensure_months + 1)])
+        if args.keep_months:
+            partitions.detach_older_than(conn, args.keep_months, drop=args.drop, dry_run=args.dry_run)
+        for month in sorted(partitions.existing(conn)):
+            print(partitions.partition_name(month))
@@ -0,0 +1,111 @@
+import json
+from collections import Counter
+
+from runtime import lazy_import
+
+np = lazy_import('numpy')
+
+class ValidationReport:
+    """Contagem agregada de rejeições: por motivo, por coluna e amostras de exemplo.
+
+    Substitui o log por linha rejeitada. Cada motivo guarda no máximo
+    `sample_size` exemplos escolhidos por amostragem de reservatório
+    (uniforme entre todas as ocorrências, com memória constante).
+    """
+
+    def __init__(self, source=None, sample_size=5, seed=None):
+        self.source = source
+        self.sample_size = sample_size
+        self.rows = 0
+        self.rejected = 0
+        self.reasons = Counter()
+        self.columns = Counter()
+        self.samples = {}
+        self._rng = np.random.default_rng(seed)
+
+    def observe(self, rows):
+        """Linhas inspecionadas (válidas ou não)"""
+        self.rows += rows
+
+    def _sample(self, reason, count, example):
+        """Algoritmo R em lote: sorteia quais das `count` novas ocorrências entram no reservatório.
+
+        `example(i)` monta o exemplo da i-ésima ocorrência do lote e só é
+        chamado para as escolhidas.
+        """
+        k = self.sample_size
+        if not k or not count:
+            return
+        seen = self.reasons[reason] - count
+        reservoir = self.samples.setdefault(reason, [])
+        positions = np.arange(count)
+        global_index = seen + positions + 1
+        chosen = (global_index <= k) | (self._rng.random(count) < k / global_index)
+        for i in np.flatnonzero(chosen):
+            if len(reservoir) < k:
+                reservoir.append(example(int(i)))
+            else:
+                reservoir[int(self._rng.integers(k))] = example(int(i))
+
+    def record(self, failures, example=None):
+        """Uma linha rejeitada com seus motivos: lista de (motivo, coluna ou None)"""
+        self.rejected += 1
+        for reason, column in failures:
+            self.reasons[reason] += 1
+            if column:
+                self.columns[column] += 1
+            if example is not None:
+                self._sample(reason, 1, lambda i: example)
+
+    def record_column(self, reason, column, count, example=None):
+        """`count` ocorrências de um mesmo motivo numa coluna (caminho colunar).
+
+        Não altera `rejected`: uma linha pode falhar em várias colunas; use
+        add_rejected() com o total de linhas rejeitadas do bloco.
+        """
+        if not count:
+            return
+        self.reasons[reason] += count
+        if column:
+            self.columns[column] += count
+        if example is not None:
+            self._sample(reason, count, example)
+
+    def add_rejected(self, count):
+        self.rejected += count
+
+    def merge(self, other):
+        """Acumula o relatório de um bloco no relatório do arquivo.
+
+        As amostras são combinadas com peso proporcional ao número de
+        ocorrências que cada reservatório representa.
+        """
+        self.rows += other.rows
+        self.rejected += other.rejected
+        for reason, count in other.reasons.items():
+            mine = self.samples.get(reason, [])
+            theirs = other.samples.get(reason, [])
+            if theirs:
+                pool = mine + theirs
+                weights = np.array([self.reasons[reason] / max(len(mine), 1)] * len(mine)
+                                   + [count / len(theirs)] * len(theirs))
+                size = min(self.sample_size, len(pool))
+                picks = self._rng.choice(len(pool), size=size, replace=False, p=weights / weights.sum())
+                self.samples[reason] = [pool[i] for i in sorted(picks)]
+            self.reasons[reason] += count
+        self.columns.update(other.columns)
+
+    def summary(self):
+        return {
+            'source': self.source,
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'rejected_pct': round(100.0 * self.rejected / self.rows, 2) if self.rows else 0.0,
+            'by_reason': dict(self.reasons.most_common()),
+            'by_column': dict(self.columns.most_common()),
+            'samples': self.samples,
+        }
+
+    def log(self, logger, label="Resumo de validação"):
+        """Uma única linha estruturada (JSON) com o resumo"""
+        logger.info(f"{label}: {json.dumps(self.summary(), ensure_ascii=False, default=str)}")
@@ -0,0 +1,2 @@
+from .db import DEFAULT_DATABASE_URL, dispose_engines, engine_options, get_engine
+from .lazy import lazy_import
@@ -7,9 +7,15 @@ CREATE TABLE IF NOT EXISTS patient (
     created_at TIMESTAMP DEFAULT now()
 );
 
+-- Particionada por mês de exam_date (partições hemogram_AAAA_MM, criadas pelo
+-- ETL conforme os meses aparecem; retenção com `python -m etl.partitions`).
+-- Chaves únicas precisam incluir a chave de partição: o upsert do ETL é por
+-- (sample_id, exam_date), e hemogram_sample_key mantém sample_id único entre
+-- partições. Bancos com hemogram não particionada:
+-- sql/migracao_hemogram_particionada.sql
 CREATE TABLE IF NOT EXISTS hemogram (
-    id SERIAL PRIMARY KEY,
-    sample_id VARCHAR(100) UNIQUE NOT NULL,
+    id SERIAL,
+    sample_id VARCHAR(100) NOT NULL,
     patient_hash VARCHAR(64) REFERENCES patient(patient_hash),
     municipality_code VARCHAR(7),
     
@@ -21,7 +27,7 @@ CREATE TABLE IF NOT EXISTS hemogram (
     neutrophils DECIMAL(6,2),
     
     -- Metadados
-    exam_date DATE,
+    exam_date DATE NOT NULL,            -- sem data no arquivo: data da carga
     patient_age INTEGER,
     lab_id VARCHAR(50),
     
@@ -29,8 +35,37 @@ CREATE TABLE IF NOT EXISTS hemogram (
     is_valid BOOLEAN DEFAULT true,
     validation_notes TEXT,
     
-    created_at TIMESTAMP DEFAULT now()
+    created_at TIMESTAMP DEFAULT now(),
+    
+    PRIMARY KEY (id, exam_date),
+    UNIQUE (sample_id, exam_date)
+) PARTITION BY RANGE (exam_date);
+
+-- Mês corrente e seguinte já existem para cargas fora do ETL
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN SELECT generate_series(date_trunc('month', now()), date_trunc('month', now()) + interval '1 month', interval '1 month')::date
+    LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF hemogram FOR VALUES FROM (%L) TO (%L)',
+                       'hemogram_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date);
+    END LOOP;
+END $$;
+
+-- Data de cada sample_id gravado. O ETL leva reenvios (sem data, que viriam
+-- com a data do dia, ou com exam_date corrigida) para a linha já existente
+-- em vez de criar outra amostra em outra partição.
+CREATE TABLE IF NOT EXISTS hemogram_sample_key (
+    sample_id VARCHAR(100) PRIMARY KEY,
+    exam_date DATE NOT NULL
 );
+-- Bancos com hemogram já carregada antes desta tabela: vale a linha mais antiga
+INSERT INTO hemogram_sample_key (sample_id, exam_date)
+SELECT DISTINCT ON (sample_id) sample_id, coalesce(exam_date, created_at::date)
+FROM hemogram
+WHERE NOT EXISTS (SELECT 1 FROM hemogram_sample_key)
+ORDER BY sample_id, id;
 
 CREATE TABLE IF NOT EXISTS alert (
     id SERIAL PRIMARY KEY,
@@ -50,11 +85,79 @@ CREATE TABLE IF NOT EXISTS alert (
     created_at TIMESTAMP DEFAULT now()
 );
 
+-- Marca d'água do processamento incremental de alertas (último hemogram.id avaliado).
+-- pending_id/pending_snapshot: max(id) visto com transações ainda em andamento;
+-- vira limite da varredura quando todas as transações do snapshot terminarem
+CREATE TABLE IF NOT EXISTS alert_watermark (
+    name VARCHAR(50) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    last_created_at TIMESTAMP,
+    pending_id BIGINT,
+    pending_snapshot pg_snapshot,
+    updated_at TIMESTAMP DEFAULT now()
+);
+-- Bancos criados antes das colunas de pendência
+ALTER TABLE alert_watermark ADD COLUMN IF NOT EXISTS pending_id BIGINT;
+ALTER TABLE alert_watermark ADD COLUMN IF NOT EXISTS pending_snapshot pg_snapshot;
+
+-- Fila de faixas de hemogram.id do modo com vários workers (alerts_engine.py --claim):
+-- cada worker trava uma faixa com FOR UPDATE SKIP LOCKED e a apaga ao gravar os alertas
+CREATE TABLE IF NOT EXISTS alert_work_batch (
+    first_id BIGINT PRIMARY KEY,
+    last_id BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+-- Agregados diários do painel: dia × município × idade × sexo.
+-- Mantido pelo ETL a cada carga (alerts_engine/rollup.py); as métricas somam
+-- estas linhas em vez de varrer hemogram. A idade exata na chave atende
+-- qualquer filtro de idade inteiro.
+-- A versão anterior era por faixa de 5 anos (age_band): é apagada aqui e
+-- recriada vazia; repopule com `python -m alerts_engine.rollup`.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'hemogram_daily_rollup' AND column_name = 'age_band') THEN
+        DROP TABLE hemogram_daily_rollup;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS hemogram_daily_rollup (
+    day DATE NOT NULL,
+    municipality_code VARCHAR(7) NOT NULL,
+    patient_age SMALLINT NOT NULL,       -- -1 = idade desconhecida
+    sex VARCHAR(1) NOT NULL,             -- 'U' = desconhecido
+    exam_count INTEGER NOT NULL DEFAULT 0,
+    hemoglobin_count INTEGER NOT NULL DEFAULT 0,
+    hemoglobin_sum NUMERIC NOT NULL DEFAULT 0,
+    platelets_count INTEGER NOT NULL DEFAULT 0,
+    platelets_sum BIGINT NOT NULL DEFAULT 0,
+    leukocytes_count INTEGER NOT NULL DEFAULT 0,
+    leukocytes_sum NUMERIC NOT NULL DEFAULT 0,
+    anemia_severe INTEGER NOT NULL DEFAULT 0,
+    anemia_moderate INTEGER NOT NULL DEFAULT 0,
+    thrombocytopenia_severe INTEGER NOT NULL DEFAULT 0,
+    thrombocytopenia_moderate INTEGER NOT NULL DEFAULT 0,
+    leukopenia INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (day, municipality_code, patient_age, sex)
+);
+
 -- Índices para performance
 CREATE INDEX IF NOT EXISTS idx_hemogram_patient_hash ON hemogram(patient_hash);
 CREATE INDEX IF NOT EXISTS idx_hemogram_municipality_code ON hemogram(municipality_code);
-CREATE INDEX IF NOT EXISTS idx_hemogram_exam_date ON hemogram(exam_date);
-CREATE INDEX IF NOT EXISTS idx_hemogram_created_at ON hemogram(created_at);
+-- BRIN nas colunas de tempo: dentro de cada partição as linhas chegam quase em
+-- ordem, e o índice ocupa alguns KB em vez de uma B-tree do tamanho da tabela
+CREATE INDEX IF NOT EXISTS idx_hemogram_exam_date ON hemogram USING BRIN (exam_date);
+CREATE INDEX IF NOT EXISTS idx_hemogram_created_at ON hemogram USING BRIN (created_at);
+-- B-tree nos campos das regras de alerta (alerts_engine/rules.py): o OR das
+-- regras empurrado ao banco vira um BitmapOr sobre estes índices
+CREATE INDEX IF NOT EXISTS idx_hemogram_hemoglobin ON hemogram(hemoglobin);
+CREATE INDEX IF NOT EXISTS idx_hemogram_platelets ON hemogram(platelets);
+CREATE INDEX IF NOT EXISTS idx_hemogram_leukocytes ON hemogram(leukocytes);
+CREATE INDEX IF NOT EXISTS idx_rollup_municipality_day ON hemogram_daily_rollup(municipality_code, day);
+-- max(updated_at) é a versão dos dados consultada pelo cache da API
+CREATE INDEX IF NOT EXISTS idx_rollup_updated_at ON hemogram_daily_rollup(updated_at);
 CREATE INDEX IF NOT EXISTS idx_alert_condition ON alert(condition);
 CREATE INDEX IF NOT EXISTS idx_alert_severity ON alert(severity);
 CREATE INDEX IF NOT EXISTS idx_alert_municipality_code ON alert(municipality_code);
@@ -0,0 +1,72 @@
+-- Converte um hemogram existente (tabela comum) na versão particionada por mês
+-- de exam_date de sql/hemograma.sql. Executar uma vez, com ETL e API parados:
+-- os dados são copiados para a nova tabela numa única transação.
+-- Hemogramas sem exam_date recebem a data de chegada, como o ETL passa a fazer.
+-- hemogram_sample_key guarda a data de cada sample_id (unicidade entre partições).
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS hemogram_sample_key (
+    sample_id VARCHAR(100) PRIMARY KEY,
+    exam_date DATE NOT NULL
+);
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'hemogram'::regclass) = 'p' THEN
+        RAISE NOTICE 'hemogram já é particionada';
+        RETURN;
+    END IF;
+
+    ALTER TABLE hemogram RENAME TO hemogram_unpartitioned;
+    ALTER TABLE hemogram_unpartitioned RENAME CONSTRAINT hemogram_pkey TO hemogram_unpartitioned_pkey;
+    ALTER TABLE hemogram_unpartitioned RENAME CONSTRAINT hemogram_sample_id_key TO hemogram_unpartitioned_sample_id_key;
+    DROP INDEX IF EXISTS idx_hemogram_patient_hash, idx_hemogram_municipality_code,
+                         idx_hemogram_exam_date, idx_hemogram_created_at,
+                         idx_hemogram_hemoglobin, idx_hemogram_platelets, idx_hemogram_leukocytes;
+
+    UPDATE hemogram_unpartitioned
+    SET exam_date = created_at::date,
+        validation_notes = coalesce(validation_notes, 'exam_date ausente: usada a data da carga')
+    WHERE exam_date IS NULL;
+
+    CREATE TABLE hemogram (
+        LIKE hemogram_unpartitioned INCLUDING DEFAULTS,
+        PRIMARY KEY (id, exam_date),
+        UNIQUE (sample_id, exam_date),
+        FOREIGN KEY (patient_hash) REFERENCES patient(patient_hash)
+    ) PARTITION BY RANGE (exam_date);
+    -- A sequência de id continua a mesma (ids e marcas d'água dos alertas valem)
+    ALTER SEQUENCE hemogram_id_seq OWNED BY hemogram.id;
+
+    FOR month IN
+        SELECT generate_series(
+            least(min(date_trunc('month', exam_date)), date_trunc('month', now())),
+            date_trunc('month', now()) + interval '1 month',
+            interval '1 month'
+        )::date
+        FROM hemogram_unpartitioned
+    LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF hemogram FOR VALUES FROM (%L) TO (%L)',
+                       'hemogram_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date);
+    END LOOP;
+
+    INSERT INTO hemogram SELECT * FROM hemogram_unpartitioned ORDER BY exam_date, id;
+    INSERT INTO hemogram_sample_key (sample_id, exam_date)
+    SELECT sample_id, exam_date FROM hemogram_unpartitioned
+    ON CONFLICT (sample_id) DO NOTHING;
+    DROP TABLE hemogram_unpartitioned;
+    -- A staging do BulkLoader foi criada a partir da tabela antiga
+    DROP TABLE IF EXISTS hemogram_staging;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_hemogram_patient_hash ON hemogram(patient_hash);
+CREATE INDEX IF NOT EXISTS idx_hemogram_municipality_code ON hemogram(municipality_code);
+CREATE INDEX IF NOT EXISTS idx_hemogram_exam_date ON hemogram USING BRIN (exam_date);
+CREATE INDEX IF NOT EXISTS idx_hemogram_created_at ON hemogram USING BRIN (created_at);
+CREATE INDEX IF NOT EXISTS idx_hemogram_hemoglobin ON hemogram(hemoglobin);
+CREATE INDEX IF NOT EXISTS idx_hemogram_platelets ON hemogram(platelets);
+CREATE INDEX IF NOT EXISTS idx_hemogram_leukocytes ON hemogram(leukocytes);
+
+COMMIT;
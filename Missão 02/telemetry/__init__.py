@@ -0,0 +1,2 @@
+from .registry import (BATCH_BUCKETS, LATENCY_BUCKETS, REGISTRY, Registry, instrument_engine,
+                       peak_rss_mb, run_summary, timed_iter)
@@ -0,0 +1,233 @@
+import json
+import resource
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# Limites (segundos) dos histogramas de latência de etapas e de consultas
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Limites (linhas) dos histogramas de tamanho de lote
+BATCH_BUCKETS = (1, 10, 100, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+PREFIX = 'hemogram'
+
+class Histogram:
+    """Histograma cumulativo de limites fixos (formato Prometheus)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+class Registry:
+    """Contadores e histogramas do processo, com rótulos.
+
+    Cada operação é um incremento sob um lock: barato o suficiente para ficar
+    ligado em produção. A etapa corrente de cada thread (stage()) é usada
+    para atribuir as idas ao banco à etapa que as fez.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._local = threading.local()
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def stage(self, name):
+        """Cronômetro de etapa: `with REGISTRY.stage('etl.load'): ...`"""
+        return StageTimer(self, name)
+
+    @property
+    def current_stage(self):
+        stack = getattr(self._local, 'stages', None)
+        return stack[-1] if stack else 'other'
+
+    def _push(self, name):
+        stack = getattr(self._local, 'stages', None)
+        if stack is None:
+            stack = self._local.stages = []
+        stack.append(name)
+
+    def _pop(self):
+        self._local.stages.pop()
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Estado atual como dict serializável (resumo JSON de uma execução)"""
+        with self._lock:
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, {})[_label_text(labels) or 'total'] = value
+            histograms = {}
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                histograms.setdefault(name, {})[_label_text(labels) or 'total'] = histogram.to_dict()
+        return {'counters': counters, 'histograms': histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def to_prometheus(self):
+        """Formato texto de exposição do Prometheus"""
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{PREFIX}_{_metric_name(name)}_total"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} counter")
+                    seen.add(metric)
+                lines.append(f"{metric}{_prom_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                metric = f"{PREFIX}_{_metric_name(name)}"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} histogram")
+                    seen.add(metric)
+                cumulative = 0
+                for bound, bucket_count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{metric}_bucket{_prom_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{metric}_sum{_prom_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{_prom_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+class StageTimer:
+    """Context manager leve (sem contextlib) que mede uma etapa e registra a duração"""
+
+    __slots__ = ('registry', 'name', 'started', 'elapsed')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.registry._push(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.started
+        self.registry._pop()
+        self.registry.observe('stage_seconds', self.elapsed, stage=self.name)
+        if exc_type is not None:
+            self.registry.count('stage_errors', stage=self.name)
+        return False
+
+def _label_text(labels):
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+def _metric_name(name):
+    return name.replace('.', '_').replace('-', '_')
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+REGISTRY = Registry()
+
+def timed_iter(iterable, stage, registry=REGISTRY):
+    """Atribui a `stage` o tempo gasto produzindo cada item (ex.: leitura de blocos do CSV)"""
+    iterator = iter(iterable)
+    while True:
+        with registry.stage(stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def peak_rss_mb():
+    """Pico de memória residente do processo, em MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    if sys.platform == 'darwin':
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+def run_summary(before, after):
+    """Diferença entre dois snapshots: o que uma execução acrescentou aos contadores/histogramas"""
+    counters = {}
+    for name, values in after['counters'].items():
+        for label, value in values.items():
+            delta = value - before['counters'].get(name, {}).get(label, 0)
+            if delta:
+                counters.setdefault(name, {})[label] = delta
+    histograms = {}
+    for name, values in after['histograms'].items():
+        for label, histogram in values.items():
+            previous = before['histograms'].get(name, {}).get(label, {'count': 0, 'sum': 0.0})
+            count = histogram['count'] - previous['count']
+            if count:
+                total = histogram['sum'] - previous['sum']
+                histograms.setdefault(name, {})[label] = {
+                    'count': count, 'sum': round(total, 6), 'mean': round(total / count, 6)
+                }
+    return {'counters': counters, 'histograms': histograms}
+
+def instrument_engine(engine, registry=REGISTRY):
+    """Conta as idas ao banco de `engine` e sua latência, atribuídas à etapa corrente da thread.
+
+    Chamado por runtime.get_engine(). COPY via cursor bruto não passa por
+    estes eventos e é contado no BulkLoader.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('telemetry_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['telemetry_started'].pop()
+        stage = registry.current_stage
+        registry.count('db_round_trips', stage=stage)
+        registry.observe('db_seconds', time.perf_counter() - started, stage=stage)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('telemetry_started') if context.connection is not None else None
+        if started:
+            started.pop()
+        registry.count('db_errors', stage=registry.current_stage)
+
+    return engine
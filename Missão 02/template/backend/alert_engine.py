@@ -1,50 +1,48 @@
-import hashlib, json
-from sqlalchemy import create_engine, text
+import os, sys
 
-DATABASE_URL = "postgresql://postgres:postgres@db:5432/hemodb"
-engine = create_engine(DATABASE_URL)
+# Regras compartilhadas com o motor principal (Missão 02/alerts_engine)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from alerts_engine.rules import DEFAULT_RULES, RuleSet
+from alerts_engine.writer import AlertWriter, RecentKeyCache
+from runtime import get_engine, lazy_import
 
-def make_alert_key(condition, sample_id):
-    return hashlib.sha1(f"{condition}|{sample_id}".encode()).hexdigest()
+# Carregados na primeira execução de process_alerts, não no import
+pd = lazy_import('pandas')
 
-def insert_alert(conn, condition, severity, sample_id, patient_hash, municipality_code, payload):
-    key = make_alert_key(condition, sample_id)
-    q = """
-    INSERT INTO alert (alert_at, condition, severity, sample_id, patient_hash, municipality_code, payload)
-    SELECT now(), :condition, :severity, :sample_id, :patient_hash, :municipality_code, :payload
-    WHERE NOT EXISTS (
-      SELECT 1 FROM alert WHERE payload->>'alert_key' = :key
-    )
-    """
-    payload["alert_key"] = key
-    conn.execute(
-        text(q),
-        dict(
-            condition=condition,
-            severity=severity,
-            sample_id=sample_id,
-            patient_hash=patient_hash,
-            municipality_code=municipality_code,
-            payload=json.dumps(payload),
-            key=key
-        )
-    )
+DATABASE_URL = os.environ.get('DATABASE_URL', "postgresql://postgres:postgres@db:5432/hemodb")
+
+# No schema do template os leucócitos ficam em `wbc`
+RULES = RuleSet(DEFAULT_RULES, columns={'leukocytes': 'wbc'})
+
+# Mantido entre execuções: chaves recentes não voltam ao banco
+WRITER = AlertWriter(recent_keys=RecentKeyCache(100000))
 
 def process_alerts():
-    with engine.begin() as conn:
-        rows = conn.execute(
-            text("SELECT * FROM hemogram WHERE created_at >= now() - interval '1 day'")
-        ).fetchall()
-        for r in rows:
-            if r.platelets and r.platelets < 50000:
-                insert_alert(conn, "platelets_lt_50k", 3, r.sample_id, r.patient_hash, r.municipality_code,
-                             {"platelets": r.platelets})
-            elif r.platelets and r.platelets < 100000:
-                insert_alert(conn, "platelets_lt_100k", 2, r.sample_id, r.patient_hash, r.municipality_code,
-                             {"platelets": r.platelets})
-            if r.hemoglobin and r.hemoglobin < 8:
-                insert_alert(conn, "hb_lt_8", 3, r.sample_id, r.patient_hash, r.municipality_code,
-                             {"hemoglobin": r.hemoglobin})
+    from sqlalchemy import text
+    rule_sql, rule_params = RULES.where_clause()
+    with get_engine(DATABASE_URL).begin() as conn:
+        # Só as linhas que disparam alguma regra saem do banco
+        result = conn.execute(
+            text(f"""
+                SELECT * FROM hemogram
+                WHERE created_at >= now() - interval '1 day'
+                AND {rule_sql}
+            """),
+            rule_params
+        )
+        rows = result.fetchall()
+        frame = pd.DataFrame(rows, columns=list(result.keys()))
+        try:
+            for rule, positions, values in RULES.evaluate(frame):
+                for pos in positions:
+                    r = rows[pos]
+                    WRITER.add(rule.condition, rule.severity, r.sample_id, r.patient_hash,
+                               r.municipality_code, {rule.field: float(values[pos])})
+            _, keys = WRITER.flush(conn)
+        except Exception:
+            WRITER.discard()
+            raise
+    WRITER.remember(keys)
 
 if __name__ == "__main__":
     process_alerts()
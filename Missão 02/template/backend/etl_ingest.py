@@ -1,14 +1,62 @@
 import json
 import hashlib
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any
-from pydantic import BaseModel, validator, ValidationError
-from sqlalchemy import create_engine, text
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+# Módulos compartilhados com o ETL principal (Missão 02/etl)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from etl.archive import ARCHIVE_DIR, ParquetArchive
+from etl.batch_ingest import ingest_directory
+from etl.bulk_loader import BulkLoader, is_data_error
+from etl.dead_letter import DeadLetterSink, ErrorRateBreaker
+from etl.partitions import SAMPLE_KEY_TABLE, MonthlyPartitions
+from etl.validation_report import ValidationReport
+from runtime import get_engine, lazy_import
+from telemetry import BATCH_BUCKETS, REGISTRY, run_summary
+
+# Carregados no primeiro registro: `etl_ingest.py` sem trabalho (ou só o
+# processo pai do modo diretório) não importa numpy nem pydantic
+np = lazy_import('numpy')
+pydantic = lazy_import('pydantic')
+models = lazy_import('hemogram_model')
 
 # Configuração
-DATABASE_URL = "postgresql://postgres:postgres@db:5432/hemodb"
-engine = create_engine(DATABASE_URL)
+DATABASE_URL = os.environ.get('DATABASE_URL', "postgresql://postgres:postgres@db:5432/hemodb")
+BATCH_SIZE = int(os.environ.get('ETL_LOAD_BATCH_SIZE', 5000))
+# Linhas lidas e validadas de uma vez no modo em blocos
+PARSE_BLOCK_SIZE = int(os.environ.get('ETL_PARSE_BLOCK_SIZE', 2000))
+# Rejeitados vão para a tabela dead_letter ('table') ou para <arquivo>.deadletter.ndjson ('file')
+DEAD_LETTER_TARGET = os.environ.get('ETL_DEAD_LETTER', 'table')
+DEAD_LETTER_BUFFER = int(os.environ.get('ETL_DEAD_LETTER_BUFFER', 500))
+# Disjuntor: aborta o arquivo se mais que esta fração das linhas for rejeitada
+MAX_ERROR_RATE = float(os.environ.get('ETL_MAX_ERROR_RATE', 0.5))
+ERROR_RATE_MIN_LINES = int(os.environ.get('ETL_ERROR_RATE_MIN_LINES', 1000))
+# Log de cada linha rejeitada só em modo de depuração; o normal é um resumo por arquivo
+DEBUG_ROWS = os.environ.get('ETL_DEBUG_ROWS', '') not in ('', '0')
+VALIDATION_SAMPLE_SIZE = int(os.environ.get('ETL_VALIDATION_SAMPLE_SIZE', 5))
+# Tamanho máximo da linha guardada como exemplo no relatório
+SAMPLE_RAW_CHARS = 500
+
+# Mesma semântica do antigo upsert_row: reenvio do sample_id atualiza
+# apenas os valores laboratoriais e updated_at
+HEMOGRAM_COLUMNS = (
+    'sample_id', 'patient_hash', 'collected_at', 'age', 'sex',
+    'hemoglobin', 'hematocrit', 'wbc', 'neutrophils_abs',
+    'lymphocytes_abs', 'platelets', 'municipality_code', 'raw'
+)
+HEMOGRAM_UPDATE_COLUMNS = ('hemoglobin', 'hematocrit', 'wbc', 'platelets')
+# Cópia opcional em Parquet (HEMOGRAM_ARCHIVE_DIR, requer pyarrow); partição pelo mês UTC de collected_at
+ARCHIVE_COLUMNS = (
+    ('sample_id', 'string'), ('patient_hash', 'string'), ('collected_at', 'timestamp'),
+    ('age', 'int64'), ('sex', 'string'), ('hemoglobin', 'double'), ('hematocrit', 'double'),
+    ('wbc', 'double'), ('neutrophils_abs', 'double'), ('lymphocytes_abs', 'double'),
+    ('platelets', 'int64'), ('municipality_code', 'string'),
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,109 +64,325 @@ logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s"
 )
 
-class Hemogram(BaseModel):
-    sample_id: str
-    patient_id: Optional[str]
-    collected_at: datetime
-    age: Optional[int]
-    sex: Optional[str]
-    hemoglobin: Optional[float]
-    hematocrit: Optional[float]
-    wbc: Optional[float]
-    neutrophils_abs: Optional[float]
-    lymphocytes_abs: Optional[float]
-    platelets: Optional[int]
-    municipality_code: Optional[str]
-
-    @validator('sex')
-    def sex_values(cls, v):
-        if v is None: return v
-        v = v.upper()
-        if v not in ('M','F','O','U'):
-            raise ValueError('invalid sex')
-        return v
-
-    @validator('age')
-    def age_ok(cls, v):
-        if v is None: return v
-        if not (0 <= v <= 130):
-            raise ValueError('age out of range')
-        return v
-
-    @validator('hemoglobin')
-    def hb_range(cls, v):
-        if v is None: return v
-        if not (2.0 <= v <= 25.0):
-            raise ValueError('hb out of range')
-        return v
-
-    @validator('platelets')
-    def plts_range(cls, v):
-        if v is None: return v
-        if not (1000 <= v <= 5000000):
-            raise ValueError('platelets out of range')
-        return v
-
 def hash_patient(pid: Optional[str]) -> Optional[str]:
     if not pid: return None
     return hashlib.sha256(pid.encode('utf-8')).hexdigest()
 
-def upsert_row(conn, data: Dict[str, Any]):
-    stmt = """
-    INSERT INTO hemogram (sample_id, patient_hash, collected_at, age, sex,
-                          hemoglobin, hematocrit, wbc, neutrophils_abs,
-                          lymphocytes_abs, platelets, municipality_code, raw)
-    VALUES (:sample_id, :patient_hash, :collected_at, :age, :sex,
-            :hemoglobin, :hematocrit, :wbc, :neutrophils_abs,
-            :lymphocytes_abs, :platelets, :municipality_code, :raw)
-    ON CONFLICT (sample_id) DO UPDATE
-      SET updated_at = now(),
-          hemoglobin = EXCLUDED.hemoglobin,
-          hematocrit = EXCLUDED.hematocrit,
-          wbc = EXCLUDED.wbc,
-          platelets = EXCLUDED.platelets;
+def make_loader(db_engine=None, batch_size=BATCH_SIZE):
+    # hemogram é particionada por mês de collected_at (template/database/schema.sql);
+    # reenvio de um sample_id (mesmo com collected_at corrigido) atualiza a linha existente
+    return BulkLoader(db_engine or get_engine(DATABASE_URL), 'hemogram', HEMOGRAM_COLUMNS,
+                      key='sample_id', update_columns=HEMOGRAM_UPDATE_COLUMNS,
+                      extra_updates={'updated_at': 'now()'}, batch_size=batch_size,
+                      conflict_key='sample_id, collected_at',
+                      partitions=MonthlyPartitions('hemogram', 'collected_at', timestamptz=True,
+                                                   key_table=SAMPLE_KEY_TABLE))
+
+def make_dead_letter(path, db_engine=None):
+    if DEAD_LETTER_TARGET == 'file':
+        return DeadLetterSink(path, path=path + ".deadletter.ndjson", buffer_size=DEAD_LETTER_BUFFER)
+    return DeadLetterSink(path, db_engine=db_engine or get_engine(DATABASE_URL), buffer_size=DEAD_LETTER_BUFFER)
+
+def make_archive(root=ARCHIVE_DIR):
+    return ParquetArchive(root, ARCHIVE_COLUMNS, 'collected_at') if root else None
+
+def archive_batch(archive, batch, path):
+    """Copia um lote já gravado para o Parquet; o nome dos arquivos vem da primeira linha do lote"""
+    columns = {name: [p.get(name) for p in batch] for name, _ in ARCHIVE_COLUMNS}
+    # Sem fuso, collected_at é tratado como UTC
+    columns['collected_at'] = [
+        dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+        for dt in (datetime.fromisoformat(p['collected_at']) for p in batch)
+    ]
+    with REGISTRY.stage('ingest.archive'):
+        archived = archive.write(columns, path, batch[0]['line_no'])
+    REGISTRY.count('rows', archived, pipeline='ndjson', outcome='archived')
+    return archived
+
+def flush_batch(loader, batch, dead_letter, report=None):
+    """Grava o lote; devolve as linhas gravadas.
+
+    Se o banco recusar os dados (DataError/IntegrityError), o lote é dividido
+    ao meio até isolar as linhas culpadas, e só elas vão para o dead letter.
+    Falhas do banco (conexão, lock, timeout) sobem: nada é descartado e o
+    checkpoint não avança.
+    """
+    REGISTRY.observe('batch_rows', len(batch), buckets=BATCH_BUCKETS, pipeline='ndjson')
+    loaded = load_or_bisect(loader, batch, dead_letter, report)
+    REGISTRY.count('rows', len(loaded), pipeline='ndjson', outcome='loaded')
+    return loaded
+
+def load_or_bisect(loader, batch, dead_letter, report=None):
+    try:
+        with REGISTRY.stage('ingest.load'):
+            loader.load_batch(batch)
+        return batch
+    except Exception as e:
+        if not is_data_error(e):
+            raise
+        if len(batch) > 1:
+            REGISTRY.count('ingest_load_bisections')
+            middle = len(batch) // 2
+            return (load_or_bisect(loader, batch[:middle], dead_letter, report)
+                    + load_or_bisect(loader, batch[middle:], dead_letter, report))
+        p = batch[0]
+        logging.warning(f"bulk load rejected line {p['line_no']}: {e}")
+        error = {"line": p["line_no"], "error": str(e), "raw": p["raw"], "reason": "bulk load failed"}
+        dead_letter.add(error["line"], error["error"], error["raw"])
+        if report is not None:
+            record_rejection(report, error)
+        return []
+
+def extract_payload(rec, raw):
+    """Campos do registro FHIR simplificado no formato do modelo Hemogram"""
+    return {
+        "sample_id": rec.get("id") or rec.get("sample_id"),
+        "patient_id": rec.get("subject", {}).get("reference"),
+        "collected_at": rec.get("effectiveDateTime"),
+        "age": rec.get("age"),
+        "sex": rec.get("sex"),
+        "hemoglobin": rec.get("hb"),
+        "hematocrit": rec.get("ht"),
+        "wbc": rec.get("wbc"),
+        "neutrophils_abs": rec.get("neutrophils_abs"),
+        "lymphocytes_abs": rec.get("lymphocytes_abs"),
+        "platelets": rec.get("platelets"),
+        "municipality_code": rec.get("municipality_code"),
+        "raw": raw
+    }
+
+def parse_line(line_no, line):
+    """Caminho original, linha a linha: devolve (payload, erro)"""
+    try:
+        rec = json.loads(line)
+        payload = extract_payload(rec, json.dumps(rec))
+        h = models.Hemogram(**payload)
+        payload["patient_hash"] = hash_patient(payload["patient_id"])
+        payload["collected_at"] = h.collected_at.isoformat()
+        payload["line_no"] = line_no
+        return payload, None
+    except pydantic.ValidationError as ve:
+        if DEBUG_ROWS:
+            logging.warning(f"validation error at line {line_no}: {ve.json()}")
+        return None, {"line": line_no, "error": ve.errors(), "raw": line}
+    except Exception as e:
+        if DEBUG_ROWS:
+            logging.exception(f"unexpected error at line {line_no}: {e}")
+        return None, {"line": line_no, "error": str(e), "raw": line, "reason": type(e).__name__}
+
+# Formatos de data/hora que datetime.fromisoformat e o pydantic interpretam igual
+FAST_DATETIME_RE = re.compile(
+    r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?(Z|[+-]\d{2}:?\d{2})?'
+)
+STR_TYPES = (type(None), str)
+FLOAT_TYPES = (type(None), int, float)
+INT_TYPES = (type(None), int)
+# Mesmos limites dos validators de Hemogram
+RANGE_CHECKS = (('age', 0, 130), ('hemoglobin', 2.0, 25.0), ('platelets', 1000, 5000000))
+
+def column_array(payloads, field, mask):
+    """Campo numérico do bloco como float; nulos e linhas já reprovadas viram NaN"""
+    return np.array([p[field] if ok and p[field] is not None else np.nan
+                     for ok, p in zip(mask, payloads)], dtype=float)
+
+def null_mask(payloads, field):
+    return np.fromiter((p[field] is None for p in payloads), dtype=bool, count=len(payloads))
+
+def fast_valid_mask(payloads):
+    """Valida o bloco inteiro contra as restrições de Hemogram sem instanciar o modelo.
+
+    Aceita só valores já no tipo final (sem coerção) e datas no formato ISO
+    estrito; o resto é reprovado aqui e reavaliado pelo pydantic, que decide
+    e gera as mensagens de erro.
     """
-    conn.execute(text(stmt), **data)
+    mask = np.fromiter((
+        type(p["sample_id"]) is str
+        and type(p["patient_id"]) in STR_TYPES
+        and type(p["collected_at"]) is str
+        and FAST_DATETIME_RE.fullmatch(p["collected_at"]) is not None
+        and type(p["age"]) in INT_TYPES
+        and (p["sex"] is None or (type(p["sex"]) is str and p["sex"].upper() in ('M', 'F', 'O', 'U')))
+        and type(p["hemoglobin"]) in FLOAT_TYPES
+        and type(p["hematocrit"]) in FLOAT_TYPES
+        and type(p["wbc"]) in FLOAT_TYPES
+        and type(p["neutrophils_abs"]) in FLOAT_TYPES
+        and type(p["lymphocytes_abs"]) in FLOAT_TYPES
+        and type(p["platelets"]) in INT_TYPES
+        and type(p["municipality_code"]) in STR_TYPES
+        for p in payloads
+    ), dtype=bool, count=len(payloads))
+    if not mask.any():
+        return mask
+    with np.errstate(invalid='ignore'):
+        for field, low, high in RANGE_CHECKS:
+            values = column_array(payloads, field, mask)
+            # NaN vindo do JSON não é nulo: cai fora do intervalo, como no pydantic
+            mask &= null_mask(payloads, field) | ((values >= low) & (values <= high))
+    return mask
+
+def parse_block(first_line_no, lines):
+    """Caminho em blocos: JSON linha a linha, validação do bloco de uma vez.
 
-def process_file(path):
+    `raw` reaproveita o texto original da linha em vez de reserializar o
+    registro. Devolve (payloads válidos, erros) com as mesmas mensagens do
+    caminho linha a linha.
+    """
+    parsed = []
     errors = []
-    accepted = 0
-    with engine.begin() as conn:
-        with open(path, 'r', encoding='utf8') as fh:
-            for line_no, line in enumerate(fh, start=1):
-                try:
-                    rec = json.loads(line)
-                    payload = {
-                        "sample_id": rec.get("id") or rec.get("sample_id"),
-                        "patient_id": rec.get("subject", {}).get("reference"),
-                        "collected_at": rec.get("effectiveDateTime"),
-                        "age": rec.get("age"),
-                        "sex": rec.get("sex"),
-                        "hemoglobin": rec.get("hb"),
-                        "hematocrit": rec.get("ht"),
-                        "wbc": rec.get("wbc"),
-                        "neutrophils_abs": rec.get("neutrophils_abs"),
-                        "lymphocytes_abs": rec.get("lymphocytes_abs"),
-                        "platelets": rec.get("platelets"),
-                        "municipality_code": rec.get("municipality_code"),
-                        "raw": json.dumps(rec)
-                    }
-                    h = Hemogram(**payload)
-                    payload["patient_hash"] = hash_patient(payload["patient_id"])
-                    payload["collected_at"] = h.collected_at.isoformat()
-                    upsert_row(conn, payload)
-                    accepted += 1
-                except ValidationError as ve:
+    with REGISTRY.stage('ingest.parse'):
+        for line_no, line in enumerate(lines, start=first_line_no):
+            try:
+                parsed.append((line_no, line, extract_payload(json.loads(line), line.rstrip('\r\n'))))
+            except Exception as e:
+                if DEBUG_ROWS:
+                    logging.exception(f"unexpected error at line {line_no}: {e}")
+                errors.append({"line": line_no, "error": str(e), "raw": line, "reason": type(e).__name__})
+    payloads = []
+    with REGISTRY.stage('ingest.validate'):
+        mask = fast_valid_mask([p for _, _, p in parsed])
+        for ok, (line_no, line, payload) in zip(mask, parsed):
+            try:
+                collected_at = None
+                if ok:
+                    try:
+                        collected_at = datetime.fromisoformat(payload["collected_at"])
+                    except ValueError:
+                        pass  # data impossível (ex.: mês 13): o pydantic gera o erro
+                if collected_at is None:
+                    collected_at = models.Hemogram(**payload).collected_at
+                payload["patient_hash"] = hash_patient(payload["patient_id"])
+                payload["collected_at"] = collected_at.isoformat()
+                payload["line_no"] = line_no
+                payloads.append(payload)
+            except pydantic.ValidationError as ve:
+                if DEBUG_ROWS:
                     logging.warning(f"validation error at line {line_no}: {ve.json()}")
-                    errors.append({"line": line_no, "error": ve.errors(), "raw": line})
-                except Exception as e:
+                errors.append({"line": line_no, "error": ve.errors(), "raw": line})
+            except Exception as e:
+                if DEBUG_ROWS:
                     logging.exception(f"unexpected error at line {line_no}: {e}")
-                    errors.append({"line": line_no, "error": str(e), "raw": line})
-    logging.info(f"Processed {path}: accepted={accepted} errors={len(errors)}")
-    if errors:
-        with open(path + ".deadletter.json", 'w', encoding='utf8') as fh:
-            json.dump(errors, fh, ensure_ascii=False, indent=2)
+                errors.append({"line": line_no, "error": str(e), "raw": line, "reason": type(e).__name__})
+    errors.sort(key=lambda e: e["line"])
+    return payloads, errors
+
+def iter_parsed(fh, start_line=0, block_size=PARSE_BLOCK_SIZE, batch_mode=True):
+    """Percorre o arquivo a partir de start_line: (última linha lida, payloads, erros)"""
+    block = []
+    first = start_line + 1
+    for line_no, line in enumerate(fh, start=1):
+        if line_no <= start_line:
+            continue
+        if not batch_mode:
+            payload, error = parse_line(line_no, line)
+            yield line_no, [payload] if payload else [], [error] if error else []
+            continue
+        block.append(line)
+        if len(block) >= block_size:
+            yield line_no, *parse_block(first, block)
+            first = line_no + 1
+            block = []
+    if block:
+        yield first + len(block) - 1, *parse_block(first, block)
+
+def record_rejection(report, error):
+    """Contabiliza um erro de linha no relatório: motivo do pydantic por campo ou tipo da exceção"""
+    if isinstance(error["error"], list):
+        failures = [(e["msg"], e["loc"][0] if e["loc"] else None) for e in error["error"]]
+    else:
+        failures = [(error.get("reason", "unexpected error"), None)]
+    report.record(failures, {"line": error["line"], "raw": error["raw"][:SAMPLE_RAW_CHARS]})
+
+def process_file(path, start_line=0, on_batch=None, batch_mode=True, dead_letter=None,
+                 breaker=None, db_engine=None, archive=None):
+    """Ingere um arquivo NDJSON; `on_batch(line_no)` é chamado após cada lote gravado
+    e `start_line` pula as linhas já concluídas (retomada de checkpoint).
+    `batch_mode=False` usa o caminho original, linha a linha.
+
+    Rejeitados seguem em lotes para o `dead_letter` conforme aparecem; o
+    `breaker` levanta ErrorRateExceeded se o arquivo for majoritariamente lixo.
+    Sem `db_engine`, usa o engine compartilhado de DATABASE_URL. Lotes gravados
+    também vão para o `archive` (padrão: HEMOGRAM_ARCHIVE_DIR, se definido)."""
+    archive = archive or make_archive()
+    dead_letter = dead_letter or make_dead_letter(path, db_engine)
+    breaker = breaker or ErrorRateBreaker(MAX_ERROR_RATE, ERROR_RATE_MIN_LINES)
+    report = ValidationReport(source=path, sample_size=VALIDATION_SAMPLE_SIZE)
+    accepted = 0
+    line_no = start_line
+    loader = make_loader(db_engine)
+    batch = []
+    before = REGISTRY.snapshot()
+    started = time.perf_counter()
+    try:
+        with dead_letter, open(path, 'r', encoding='utf8') as fh:
+            for block_end, payloads, block_errors in iter_parsed(fh, start_line, batch_mode=batch_mode):
+                report.observe(block_end - line_no)
+                REGISTRY.count('rows', block_end - line_no, pipeline='ndjson', outcome='processed')
+                REGISTRY.count('rows', len(payloads), pipeline='ndjson', outcome='valid')
+                REGISTRY.count('rows', len(block_errors), pipeline='ndjson', outcome='rejected')
+                line_no = block_end
+                for error in block_errors:
+                    record_rejection(report, error)
+                dead_letter.extend(block_errors)
+                batch.extend(payloads)
+                if len(batch) >= loader.batch_size:
+                    loaded = flush_batch(loader, batch, dead_letter, report)
+                    if archive and loaded:
+                        archive_batch(archive, loaded, path)
+                    accepted += len(loaded)
+                    batch = []
+                    if on_batch:
+                        # Rejeitados até aqui precisam estar gravados antes do checkpoint
+                        dead_letter.flush()
+                        on_batch(line_no)
+                breaker.check(line_no - start_line, dead_letter.count)
+            if batch:
+                loaded = flush_batch(loader, batch, dead_letter, report)
+                if archive and loaded:
+                    archive_batch(archive, loaded, path)
+                accepted += len(loaded)
+            dead_letter.flush()
+    finally:
+        # Um único resumo por arquivo, inclusive quando o disjuntor aborta
+        report.log(logging, f"Validation summary for {path}")
+    if on_batch:
+        on_batch(line_no)
+    elapsed = time.perf_counter() - started
+    lines = line_no - start_line
+    logging.info(f"Processed {path}: accepted={accepted} errors={dead_letter.count} "
+                 f"rows/s={lines / elapsed if elapsed else 0:.0f}")
+    return {"lines": lines, "accepted": accepted, "errors": dead_letter.count,
+            "rows_per_s": round(lines / elapsed, 1) if elapsed else None,
+            "validation": report.summary(),
+            "telemetry": run_summary(before, REGISTRY.snapshot())}
+
+def benchmark_parsing(path, repeat=3):
+    """Linhas/s só do parsing e validação (sem banco), linha a linha vs. em blocos"""
+    results = {}
+    for mode, batch_mode in (('line', False), ('block', True)):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            lines = accepted = 0
+            with open(path, 'r', encoding='utf8') as fh:
+                for lines, payloads, _ in iter_parsed(fh, batch_mode=batch_mode):
+                    accepted += len(payloads)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[mode] = {"lines": lines, "accepted": accepted,
+                         "rows_per_s": round(lines / best, 1) if best else None}
+    results["speedup"] = round(results["block"]["rows_per_s"] / results["line"]["rows_per_s"], 2)
+    return results
+
+def ingest_ndjson_file(path, checkpoint):
+    """Adaptador para ingest_directory: retoma do checkpoint e o atualiza a cada lote"""
+    return process_file(path, start_line=checkpoint.position, on_batch=checkpoint.save)
 
 if __name__ == "__main__":
-    import sys
-    process_file(sys.argv[1])
+    target = sys.argv[1]
+    if target == '--bench':
+        print(json.dumps(benchmark_parsing(sys.argv[2]), indent=2))
+    elif os.path.isdir(target):
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        ingest_directory(target, ingest_ndjson_file, pattern='*.ndjson', workers=workers, rows_key='lines')
+    else:
+        process_file(target)
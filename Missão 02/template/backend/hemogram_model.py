@@ -0,0 +1,49 @@
+# Modelo pydantic do registro NDJSON; o etl_ingest só o importa no primeiro registro validado
+
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, validator
+
+class Hemogram(BaseModel):
+    sample_id: str
+    patient_id: Optional[str]
+    collected_at: datetime
+    age: Optional[int]
+    sex: Optional[str]
+    hemoglobin: Optional[float]
+    hematocrit: Optional[float]
+    wbc: Optional[float]
+    neutrophils_abs: Optional[float]
+    lymphocytes_abs: Optional[float]
+    platelets: Optional[int]
+    municipality_code: Optional[str]
+
+    @validator('sex')
+    def sex_values(cls, v):
+        if v is None: return v
+        v = v.upper()
+        if v not in ('M','F','O','U'):
+            raise ValueError('invalid sex')
+        return v
+
+    @validator('age')
+    def age_ok(cls, v):
+        if v is None: return v
+        if not (0 <= v <= 130):
+            raise ValueError('age out of range')
+        return v
+
+    @validator('hemoglobin')
+    def hb_range(cls, v):
+        if v is None: return v
+        if not (2.0 <= v <= 25.0):
+            raise ValueError('hb out of range')
+        return v
+
+    @validator('platelets')
+    def plts_range(cls, v):
+        if v is None: return v
+        if not (1000 <= v <= 5000000):
+            raise ValueError('platelets out of range')
+        return v
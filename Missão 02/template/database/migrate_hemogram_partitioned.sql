@@ -0,0 +1,62 @@
+-- Converte um hemogram existente (tabela comum) na versão particionada por mês
+-- de collected_at de schema.sql. Executar uma vez, com ingestão parada: os
+-- dados são copiados para a nova tabela numa única transação.
+-- hemogram_sample_key guarda o collected_at de cada sample_id (unicidade entre partições).
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS hemogram_sample_key (
+  sample_id TEXT PRIMARY KEY,
+  collected_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+DO $$
+DECLARE
+  month TIMESTAMP;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'hemogram'::regclass) = 'p' THEN
+    RAISE NOTICE 'hemogram já é particionada';
+    RETURN;
+  END IF;
+
+  ALTER TABLE hemogram RENAME TO hemogram_unpartitioned;
+  ALTER TABLE hemogram_unpartitioned RENAME CONSTRAINT hemogram_pkey TO hemogram_unpartitioned_pkey;
+  ALTER TABLE hemogram_unpartitioned RENAME CONSTRAINT hemogram_sample_id_key TO hemogram_unpartitioned_sample_id_key;
+  DROP INDEX IF EXISTS idx_hemogram_collected_at, idx_hemogram_municipality_collected_at,
+                       idx_hemogram_platelets, idx_hemogram_hemoglobin;
+
+  CREATE TABLE hemogram (
+    LIKE hemogram_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (id, collected_at),
+    UNIQUE (sample_id, collected_at)
+  ) PARTITION BY RANGE (collected_at);
+  ALTER SEQUENCE hemogram_id_seq OWNED BY hemogram.id;
+
+  FOR month IN
+    SELECT generate_series(
+      least(min(date_trunc('month', collected_at AT TIME ZONE 'UTC')), date_trunc('month', now() AT TIME ZONE 'UTC')),
+      date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month',
+      interval '1 month'
+    )
+    FROM hemogram_unpartitioned
+  LOOP
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF hemogram FOR VALUES FROM (%L) TO (%L)',
+                   'hemogram_' || to_char(month, 'YYYY_MM'),
+                   month AT TIME ZONE 'UTC', (month + interval '1 month') AT TIME ZONE 'UTC');
+  END LOOP;
+
+  INSERT INTO hemogram SELECT * FROM hemogram_unpartitioned ORDER BY collected_at, id;
+  INSERT INTO hemogram_sample_key (sample_id, collected_at)
+  SELECT sample_id, collected_at FROM hemogram_unpartitioned
+  ON CONFLICT (sample_id) DO NOTHING;
+  DROP TABLE hemogram_unpartitioned;
+  -- A staging do BulkLoader foi criada a partir da tabela antiga
+  DROP TABLE IF EXISTS hemogram_staging;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_hemogram_collected_at ON hemogram USING BRIN (collected_at);
+CREATE INDEX IF NOT EXISTS idx_hemogram_created_at ON hemogram USING BRIN (created_at);
+CREATE INDEX IF NOT EXISTS idx_hemogram_municipality_collected_at ON hemogram (municipality_code, collected_at);
+CREATE INDEX IF NOT EXISTS idx_hemogram_platelets ON hemogram (platelets);
+CREATE INDEX IF NOT EXISTS idx_hemogram_hemoglobin ON hemogram (hemoglobin);
+
+COMMIT;
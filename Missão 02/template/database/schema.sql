@@ -1,8 +1,13 @@
 -- schema definitivo: hemogram + alerts + dead_letter
 
+-- Particionada por mês de collected_at (limites em UTC; partições
+-- hemogram_AAAA_MM criadas pelo etl_ingest conforme os meses aparecem).
+-- Unicidade e upsert por (sample_id, collected_at); hemogram_sample_key mantém
+-- sample_id único entre partições. Bancos com hemogram não particionada:
+-- migrate_hemogram_partitioned.sql
 CREATE TABLE IF NOT EXISTS hemogram (
-  id BIGSERIAL PRIMARY KEY,
-  sample_id TEXT NOT NULL UNIQUE,
+  id BIGSERIAL,
+  sample_id TEXT NOT NULL,
   patient_hash TEXT,
   collected_at TIMESTAMP WITH TIME ZONE NOT NULL,
   received_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
@@ -26,16 +31,49 @@ CREATE TABLE IF NOT EXISTS hemogram (
   flags JSONB,
   raw JSONB,
   created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+  PRIMARY KEY (id, collected_at),
+  UNIQUE (sample_id, collected_at)
+) PARTITION BY RANGE (collected_at);
+
+DO $$
+DECLARE
+  month TIMESTAMP;
+BEGIN
+  FOR month IN SELECT generate_series(date_trunc('month', now() AT TIME ZONE 'UTC'),
+                                      date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month',
+                                      interval '1 month')
+  LOOP
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF hemogram FOR VALUES FROM (%L) TO (%L)',
+                   'hemogram_' || to_char(month, 'YYYY_MM'),
+                   month AT TIME ZONE 'UTC', (month + interval '1 month') AT TIME ZONE 'UTC');
+  END LOOP;
+END $$;
+
+-- collected_at de cada sample_id gravado: reenvio com collected_at corrigido
+-- atualiza a linha existente em vez de criar outra em outra partição
+CREATE TABLE IF NOT EXISTS hemogram_sample_key (
+  sample_id TEXT PRIMARY KEY,
+  collected_at TIMESTAMP WITH TIME ZONE NOT NULL
 );
+-- Bancos com hemogram já carregada antes desta tabela: vale a linha mais antiga
+INSERT INTO hemogram_sample_key (sample_id, collected_at)
+SELECT DISTINCT ON (sample_id) sample_id, collected_at
+FROM hemogram
+WHERE NOT EXISTS (SELECT 1 FROM hemogram_sample_key)
+ORDER BY sample_id, id;
 
-CREATE INDEX IF NOT EXISTS idx_hemogram_collected_at ON hemogram (collected_at);
+-- BRIN nas colunas de chegada quase ordenada; B-tree onde há filtro por igualdade
+CREATE INDEX IF NOT EXISTS idx_hemogram_collected_at ON hemogram USING BRIN (collected_at);
+CREATE INDEX IF NOT EXISTS idx_hemogram_created_at ON hemogram USING BRIN (created_at);
 CREATE INDEX IF NOT EXISTS idx_hemogram_municipality_collected_at ON hemogram (municipality_code, collected_at);
 CREATE INDEX IF NOT EXISTS idx_hemogram_platelets ON hemogram (platelets);
 CREATE INDEX IF NOT EXISTS idx_hemogram_hemoglobin ON hemogram (hemoglobin);
+CREATE INDEX IF NOT EXISTS idx_hemogram_wbc ON hemogram (wbc);
 
 CREATE TABLE IF NOT EXISTS alert (
   id BIGSERIAL PRIMARY KEY,
+  alert_key TEXT UNIQUE,
   alert_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
   condition TEXT NOT NULL,
   severity SMALLINT NOT NULL,
@@ -47,6 +85,10 @@ CREATE TABLE IF NOT EXISTS alert (
   resolved_at TIMESTAMP WITH TIME ZONE
 );
 
+-- Bancos criados antes da coluna alert_key (dedup via ON CONFLICT (alert_key))
+ALTER TABLE alert ADD COLUMN IF NOT EXISTS alert_key TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_alert_alert_key ON alert (alert_key);
+
 CREATE INDEX IF NOT EXISTS idx_alert_municipality ON alert (municipality_code);
 CREATE INDEX IF NOT EXISTS idx_alert_severity ON alert (severity);
 
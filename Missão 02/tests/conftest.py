@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos são importados a partir de "Missão 02", como em app.py e nos scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL') or os.environ.get('DATABASE_URL')
+
+SCHEMA = os.path.join(ROOT, 'sql', 'hemograma.sql')
+
+@pytest.fixture(scope='session')
+def db_engine():
+    """Engine do banco de teste com o schema de sql/hemograma.sql aplicado; sem banco o teste é pulado"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("defina TEST_DATABASE_URL (banco PostgreSQL descartável)")
+    from sqlalchemy import create_engine
+    engine = create_engine(TEST_DATABASE_URL)
+    try:
+        # Cursor do driver sem parâmetros: o script tem '%' (format) e blocos DO
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cursor, open(SCHEMA, encoding='utf8') as fh:
+                cursor.execute(fh.read())
+            raw.commit()
+        finally:
+            raw.close()
+    except Exception as e:
+        engine.dispose()
+        pytest.skip(f"banco de teste indisponível: {e}")
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def test_samples(db_engine):
+    """Apaga, ao fim do teste, alertas e hemogramas com sample_id 'TEST-%', os pacientes 'TEST-%' e as marcas d'água 'test%'"""
+    from sqlalchemy import text
+    yield 'TEST-'
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM alert WHERE sample_id LIKE 'TEST-%'"))
+        conn.execute(text("DELETE FROM hemogram WHERE sample_id LIKE 'TEST-%'"))
+        conn.execute(text("DELETE FROM hemogram_sample_key WHERE sample_id LIKE 'TEST-%'"))
+        conn.execute(text("DELETE FROM patient WHERE patient_hash LIKE 'TEST-%'"))
+        conn.execute(text("DELETE FROM alert_watermark WHERE name LIKE 'test%'"))
@@ -0,0 +1,96 @@
+from sqlalchemy import text
+
+from alerts_engine.alerts_engine import AlertEngine
+from alerts_engine.trends import PatientWindowIndex
+
+INSERT_HEMOGRAM = text("""
+    INSERT INTO hemogram (sample_id, municipality_code, patient_hash, hemoglobin, exam_date)
+    VALUES (:sample_id, '5300108', :patient_hash, :hemoglobin, current_date - :days_ago)
+    RETURNING id
+""")
+
+class GuardedIndex(PatientWindowIndex):
+    """Índice que registra qualquer leitura ou escrita feita nele"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def history(self, patient_hash, ts):
+        self.calls.append('history')
+        return super().history(patient_hash, ts)
+
+    def add(self, patient_hash, ts, sample_id, values):
+        self.calls.append('add')
+        super().add(patient_hash, ts, sample_id, values)
+
+    def evict(self):
+        self.calls.append('evict')
+        super().evict()
+
+def _worker(db_engine):
+    engine = AlertEngine(db_engine, batch_size=1, watermark_name='test_claim')
+    engine.patient_index = GuardedIndex(engine.patient_index.window, engine.patient_index.fields)
+    return engine
+
+def _start_claim_watermark(db_engine, engine):
+    # Pelo último id sorteado: com a tabela vazia max(id) voltaria ao início da sequência
+    with db_engine.begin() as conn:
+        start = conn.execute(text(
+            "SELECT coalesce(pg_sequence_last_value(pg_get_serial_sequence('hemogram', 'id')), 0)"
+        )).scalar()
+        engine._save_watermark(conn, start, name='test_claim:claim')
+
+def _clear_queue(db_engine):
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM alert_work_batch"))
+
+def test_claimed_batches_never_touch_the_shared_index(db_engine, test_samples):
+    workers = [_worker(db_engine), _worker(db_engine)]
+    _start_claim_watermark(db_engine, workers[0])
+    with db_engine.begin() as conn:
+        conn.execute(text("INSERT INTO patient (patient_hash) VALUES ('TEST-PATIENT')"))
+        conn.execute(INSERT_HEMOGRAM, {'sample_id': 'TEST-CLAIM-1', 'patient_hash': 'TEST-PATIENT',
+                                       'hemoglobin': 13.0, 'days_ago': 1})
+        conn.execute(INSERT_HEMOGRAM, {'sample_id': 'TEST-CLAIM-2', 'patient_hash': 'TEST-PATIENT',
+                                       'hemoglobin': 10.0, 'days_ago': 0})
+    try:
+        # Um lote por worker: o segundo vê o primeiro exame só pelo histórico do banco
+        for worker in workers:
+            worker.process_claimed(max_batches=1)
+        with db_engine.connect() as conn:
+            drop = conn.execute(text("""
+                SELECT count(*) FROM alert
+                WHERE sample_id = 'TEST-CLAIM-2' AND condition = 'hb_drop_15pct_72h'
+            """)).scalar()
+    finally:
+        _clear_queue(db_engine)
+    assert drop == 1
+    for worker in workers:
+        assert worker.patient_index.calls == []
+        assert len(worker.patient_index) == 0 and worker.patient_index.latest is None
+
+def test_enqueue_skips_no_lower_id_committed_late(db_engine, test_samples):
+    engine = AlertEngine(db_engine, batch_size=1, watermark_name='test_claim')
+    _start_claim_watermark(db_engine, engine)
+    late = db_engine.connect()
+    late_tx = late.begin()
+    try:
+        low_id = late.execute(INSERT_HEMOGRAM, {'sample_id': 'TEST-CLAIM-LOW', 'patient_hash': None,
+                                                'hemoglobin': 6.5, 'days_ago': 0}).scalar()
+        with db_engine.begin() as conn:
+            high_id = conn.execute(INSERT_HEMOGRAM, {'sample_id': 'TEST-CLAIM-HIGH', 'patient_hash': None,
+                                                     'hemoglobin': 6.5, 'days_ago': 0}).scalar()
+        assert low_id < high_id
+        engine.enqueue_work()
+        with db_engine.connect() as conn:
+            assert engine.get_watermark(conn, name='test_claim:claim') < low_id
+        late_tx.commit()
+        engine.enqueue_work()
+        with db_engine.connect() as conn:
+            queued = conn.execute(text("SELECT first_id, last_id FROM alert_work_batch")).fetchall()
+        assert any(b.first_id <= low_id <= b.last_id for b in queued)
+        assert any(b.first_id <= high_id <= b.last_id for b in queued)
+    finally:
+        late.close()
+        _clear_queue(db_engine)
@@ -0,0 +1,42 @@
+from sqlalchemy import text
+
+from alerts_engine.stream import AlertBroadcaster
+
+INSERT_ALERT = text("""
+    INSERT INTO alert (alert_key, condition, severity, sample_id, municipality_code)
+    VALUES (:sample_id, 'test_condition', 3, :sample_id, '5300108')
+    RETURNING id
+""")
+
+def _published(broadcaster):
+    return [alert['id'] for alert in broadcaster._buffer]
+
+def test_lower_id_committed_late_is_pushed_and_kept_behind_the_cursor(db_engine, test_samples):
+    broadcaster = AlertBroadcaster(db_engine)
+    # Sem a thread: o teste faz o início de start() e chama a consulta diretamente
+    with db_engine.connect() as conn:
+        broadcaster._last_id = conn.execute(text("SELECT coalesce(max(id), 0) FROM alert")).scalar()
+        broadcaster._last_id = broadcaster._floor = broadcaster._safe_id(conn)
+    start_id = broadcaster._last_id
+    
+    late = db_engine.connect()
+    late_tx = late.begin()
+    try:
+        low_id = late.execute(INSERT_ALERT, {'sample_id': 'TEST-STREAM-LOW'}).scalar()
+        with db_engine.begin() as conn:
+            high_id = conn.execute(INSERT_ALERT, {'sample_id': 'TEST-STREAM-HIGH'}).scalar()
+        assert low_id < high_id
+        
+        # Com a transação do id menor aberta o cursor não passa por ele
+        broadcaster._fetch_new()
+        assert _published(broadcaster) == []
+        assert broadcaster._last_id < low_id
+        # Reconexão com o cursor atual também não pula o id menor
+        assert broadcaster._query_latest(start_id) == []
+        
+        late_tx.commit()
+    finally:
+        late.close()
+    broadcaster._fetch_new()
+    assert _published(broadcaster) == [low_id, high_id]
+    assert broadcaster._last_id >= high_id
@@ -0,0 +1,56 @@
+from datetime import date
+
+from sqlalchemy import text
+
+from alerts_engine.alerts_engine import AlertEngine
+from etl.partitions import MonthlyPartitions, add_months, month_start
+
+INSERT_HEMOGRAM = text("""
+    INSERT INTO hemogram (sample_id, municipality_code, hemoglobin, exam_date)
+    VALUES (:sample_id, '5300108', 6.5, current_date)
+    RETURNING id
+""")
+
+def _alerted(db_engine, *sample_ids):
+    with db_engine.connect() as conn:
+        rows = conn.execute(text("SELECT DISTINCT sample_id FROM alert WHERE sample_id = ANY(:ids)"),
+                            {'ids': list(sample_ids)}).fetchall()
+    return {r.sample_id for r in rows}
+
+def test_lower_id_committed_after_watermark_advance_is_evaluated(db_engine, test_samples):
+    engine = AlertEngine(db_engine, watermark_name='test_late_commit', trend_rules=[])
+    with db_engine.begin() as conn:
+        start = conn.execute(text("SELECT coalesce(max(id), 0) FROM hemogram")).scalar()
+        engine._save_watermark(conn, start)
+    
+    late = db_engine.connect()
+    late_tx = late.begin()
+    low_id = late.execute(INSERT_HEMOGRAM, {'sample_id': 'TEST-LATE-LOW'}).scalar()
+    with db_engine.begin() as conn:
+        high_id = conn.execute(INSERT_HEMOGRAM, {'sample_id': 'TEST-LATE-HIGH'}).scalar()
+    assert low_id < high_id
+    
+    # Com a transação do id menor aberta a marca d'água não passa por ele
+    engine.process_alerts()
+    with db_engine.connect() as conn:
+        assert engine.get_watermark(conn, name='test_late_commit') < low_id
+    
+    late_tx.commit()
+    late.close()
+    engine.process_alerts()
+    assert _alerted(db_engine, 'TEST-LATE-LOW', 'TEST-LATE-HIGH') == {'TEST-LATE-LOW', 'TEST-LATE-HIGH'}
+
+def test_new_row_in_an_old_partition_is_evaluated(db_engine, test_samples):
+    # Exame antigo carregado agora: id novo, exam_date num mês já fechado
+    old_day = add_months(month_start(date.today()), -3)
+    engine = AlertEngine(db_engine, watermark_name='test_old_partition', trend_rules=[])
+    with db_engine.begin() as conn:
+        MonthlyPartitions('hemogram', 'exam_date').ensure(conn, [old_day])
+        start = conn.execute(text("SELECT coalesce(max(id), 0) FROM hemogram")).scalar()
+        engine._save_watermark(conn, start)
+        conn.execute(text("""
+            INSERT INTO hemogram (sample_id, municipality_code, hemoglobin, exam_date)
+            VALUES ('TEST-OLD-MONTH', '5300108', 6.5, :day)
+        """), {'day': old_day})
+    engine.process_alerts()
+    assert _alerted(db_engine, 'TEST-OLD-MONTH') == {'TEST-OLD-MONTH'}
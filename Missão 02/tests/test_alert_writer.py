@@ -0,0 +1,73 @@
+from sqlalchemy.dialects import postgresql
+
+from alerts_engine.writer import ALERT_CHANNEL, AlertWriter, RecentKeyCache, make_alert_key
+
+class FakeConnection:
+    """Registra os INSERTs e simula ON CONFLICT DO NOTHING com as chaves já gravadas"""
+
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.batches = []
+        self.notifies = []
+
+    def execute(self, stmt, params=None):
+        if params is not None:
+            self.notifies.append(params)
+            return None
+        compiled = stmt.compile(dialect=postgresql.dialect()).params
+        keys = [v for k, v in compiled.items() if k.startswith('alert_key')]
+        self.batches.append(keys)
+        new = [key for key in keys if key not in self.existing]
+        self.existing.update(new)
+        return type('Result', (), {'rowcount': len(new)})()
+
+def _add(writer, condition, sample_id):
+    return writer.add(condition, 3, sample_id, 'hash', '5300108', {'platelets': 40000})
+
+def test_recent_key_cache_evicts_least_recently_used():
+    cache = RecentKeyCache(maxsize=2)
+    cache.add('a')
+    cache.add('b')
+    assert 'a' in cache  # consulta renova 'a'
+    cache.add('c')
+    assert len(cache) == 2
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+
+def test_add_skips_pending_and_remembered_keys():
+    writer = AlertWriter(recent_keys=RecentKeyCache(maxsize=10))
+    assert _add(writer, 'platelets_lt_50k', 'S1')
+    assert not _add(writer, 'platelets_lt_50k', 'S1')
+    assert _add(writer, 'hb_lt_8', 'S1')
+    writer.remember([make_alert_key('platelets_lt_50k', 'S2')])
+    assert not _add(writer, 'platelets_lt_50k', 'S2')
+
+def test_flush_inserts_in_batches_and_notifies_once():
+    writer = AlertWriter(batch_size=2)
+    for i in range(5):
+        _add(writer, 'platelets_lt_50k', f'S{i}')
+    conn = FakeConnection(existing=[make_alert_key('platelets_lt_50k', 'S0')])
+    inserted, keys = writer.flush(conn)
+    assert [len(batch) for batch in conn.batches] == [2, 2, 1]
+    assert inserted == 4
+    assert len(keys) == 5
+    assert conn.notifies == [{'channel': ALERT_CHANNEL, 'payload': '4'}]
+    # Depois do flush nada fica pendente
+    assert writer.flush(FakeConnection()) == (0, [])
+
+def test_flush_without_new_rows_does_not_notify():
+    writer = AlertWriter()
+    _add(writer, 'hb_lt_8', 'S1')
+    conn = FakeConnection(existing=[make_alert_key('hb_lt_8', 'S1')])
+    assert writer.flush(conn)[0] == 0
+    assert conn.notifies == []
+
+def test_keys_enter_the_lru_only_after_remember():
+    writer = AlertWriter()
+    _add(writer, 'hb_lt_8', 'S1')
+    _, keys = writer.flush(FakeConnection())
+    # Transação desfeita: sem remember a chave pode ser gravada de novo
+    assert _add(writer, 'hb_lt_8', 'S1')
+    writer.discard()
+    writer.remember(keys)
+    assert not _add(writer, 'hb_lt_8', 'S1')
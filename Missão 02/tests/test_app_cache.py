@@ -0,0 +1,61 @@
+import importlib.util
+import os
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from alerts_engine.rollup import refresh_daily_rollup
+
+MUNICIPALITY = '9999991'
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+@pytest.fixture(scope='module')
+def api(db_engine):
+    """app.py carregado pelo caminho (o template também tem um app.py) com DATABASE_URL do banco de teste"""
+    spec = importlib.util.spec_from_file_location('hemogram_api_app', APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = app
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('DATABASE_URL', db_engine.url.render_as_string(hide_password=False))
+        spec.loader.exec_module(app)
+    app.result_cache.version_interval = 0
+    yield app
+    sys.modules.pop(spec.name, None)
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM hemogram_daily_rollup WHERE municipality_code = :m"),
+                     {'m': MUNICIPALITY})
+
+def _load(db_engine, *samples):
+    """Carga feita fora da API (como o CLI ou a ingestão em lote): nenhum listener é chamado"""
+    with db_engine.begin() as conn:
+        for sample in samples:
+            conn.execute(text("""
+                INSERT INTO hemogram (sample_id, municipality_code, hemoglobin, exam_date, patient_age)
+                VALUES (:sample_id, :municipality_code, 7.5, current_date, 30)
+            """), {'sample_id': f"TEST-CACHE-{sample}", 'municipality_code': MUNICIPALITY})
+        refresh_daily_rollup(conn, [(date.today(), MUNICIPALITY)])
+
+def test_unchanged_metrics_answer_304(db_engine, test_samples, api):
+    _load(db_engine, 1, 2)
+    client = api.app.test_client()
+    first = client.get(f'/metrics?municipality_code={MUNICIPALITY}')
+    assert first.status_code == 200
+    assert first.get_json()['total_exams'] == 2
+    again = client.get(f'/metrics?municipality_code={MUNICIPALITY}',
+                       headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+def test_load_from_another_process_invalidates_the_cache(db_engine, test_samples, api):
+    _load(db_engine, 1)
+    client = api.app.test_client()
+    first = client.get(f'/metrics?municipality_code={MUNICIPALITY}')
+    assert first.get_json()['total_exams'] == 1
+    _load(db_engine, 2, 3)
+    after = client.get(f'/metrics?municipality_code={MUNICIPALITY}',
+                       headers={'If-None-Match': first.headers['ETag']})
+    assert after.status_code == 200
+    assert after.get_json()['total_exams'] == 3
+    assert after.headers['ETag'] != first.headers['ETag']
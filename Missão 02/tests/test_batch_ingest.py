@@ -0,0 +1,79 @@
+import json
+import os
+
+from etl.batch_ingest import MANIFEST_NAME, FileCheckpoint, IngestManifest, file_checksum, ingest_directory
+
+def ingest_lines(path, checkpoint):
+    """Copia as linhas do arquivo para <arquivo>.out a partir do checkpoint, uma por "lote".
+
+    Com <arquivo>.fail presente, falha depois de gravar a segunda linha.
+    """
+    with open(path, encoding='utf8') as fh:
+        lines = fh.read().splitlines()
+    start = checkpoint.position
+    with open(path + '.out', 'a', encoding='utf8') as out:
+        for position in range(start, len(lines)):
+            out.write(lines[position] + '\n')
+            out.flush()
+            checkpoint.save(position + 1)
+            if position + 1 == 2 and os.path.exists(path + '.fail'):
+                raise RuntimeError("falha simulada")
+    return {'processed': len(lines) - start}
+
+def _write(path, lines):
+    with open(path, 'w', encoding='utf8') as fh:
+        fh.write('\n'.join(lines) + '\n')
+
+def _read(path):
+    with open(path, encoding='utf8') as fh:
+        return fh.read().splitlines()
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'a.json')
+    FileCheckpoint(path).save(42)
+    assert FileCheckpoint(path).position == 42
+    FileCheckpoint(path).clear()
+    assert FileCheckpoint(path).position == 0
+
+def test_manifest_done_only_with_same_checksum(tmp_path):
+    manifest = IngestManifest(str(tmp_path))
+    manifest.update('a.csv', status='done', checksum='abc')
+    reloaded = IngestManifest(str(tmp_path))
+    assert reloaded.is_done('a.csv', 'abc')
+    assert not reloaded.is_done('a.csv', 'def')
+    assert not reloaded.is_done('b.csv', 'abc')
+
+def test_failed_file_resumes_from_checkpoint_and_done_file_is_skipped(tmp_path):
+    first, second = str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')
+    _write(first, ['a1', 'a2', 'a3'])
+    _write(second, ['b1', 'b2', 'b3', 'b4'])
+    open(second + '.fail', 'w').close()
+
+    report = ingest_directory(str(tmp_path), ingest_lines, workers=1)
+    assert (report['files_done'], report['files_failed']) == (1, 1)
+    with open(tmp_path / MANIFEST_NAME, encoding='utf8') as fh:
+        files = json.load(fh)
+    assert files['a.csv']['status'] == 'done'
+    assert (files['b.csv']['status'], files['b.csv']['position']) == ('failed', 2)
+
+    os.remove(second + '.fail')
+    report = ingest_directory(str(tmp_path), ingest_lines, workers=1)
+    assert (report['files'], report['skipped_files'], report['rows']) == (1, 1, 2)
+    # Nenhuma linha repetida nem perdida
+    assert _read(first + '.out') == ['a1', 'a2', 'a3']
+    assert _read(second + '.out') == ['b1', 'b2', 'b3', 'b4']
+    assert not os.listdir(tmp_path / '.ingest_checkpoints')
+
+def test_changed_file_starts_over(tmp_path):
+    path = str(tmp_path / 'a.csv')
+    _write(path, ['a1', 'a2', 'a3'])
+    open(path + '.fail', 'w').close()
+    ingest_directory(str(tmp_path), ingest_lines, workers=1)
+    old_checksum = file_checksum(path)
+
+    os.remove(path + '.fail')
+    os.remove(path + '.out')
+    _write(path, ['c1', 'c2'])
+    ingest_directory(str(tmp_path), ingest_lines, workers=1)
+    assert _read(path + '.out') == ['c1', 'c2']
+    assert not os.path.exists(tmp_path / '.ingest_checkpoints' / f"{old_checksum}.json")
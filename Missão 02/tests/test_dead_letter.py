@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from etl.dead_letter import DeadLetterSink, ErrorRateBreaker, ErrorRateExceeded, raw_json
+
+def test_breaker_waits_for_min_lines():
+    breaker = ErrorRateBreaker(max_rate=0.1, min_lines=100)
+    breaker.check(99, 99)  # início do arquivo todo ruim: ainda não avalia
+
+def test_breaker_trips_only_above_max_rate():
+    breaker = ErrorRateBreaker(max_rate=0.1, min_lines=100)
+    breaker.check(100, 10)
+    with pytest.raises(ErrorRateExceeded):
+        breaker.check(100, 11)
+
+def test_breaker_without_max_rate_never_trips():
+    ErrorRateBreaker(max_rate=None, min_lines=0).check(10, 10)
+
+def test_sink_buffer_flushes_at_buffer_size(tmp_path):
+    path = tmp_path / 'dead.ndjson'
+    sink = DeadLetterSink('input.ndjson', path=str(path), buffer_size=3)
+    for line_no in range(1, 5):
+        sink.add(line_no, 'erro', '{"id": "S%d"}\n' % line_no)
+    assert len(path.read_text().splitlines()) == 3
+    sink.close()
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r['line_no'] for r in rows] == [1, 2, 3, 4]
+    assert rows[0]['raw'] == {'id': 'S1'}
+    assert sink.count == 4
+
+def test_raw_that_is_not_json_for_postgres_is_kept_as_text():
+    assert raw_json('{"hb": NaN}\n') == '{"hb": NaN}'
+    assert raw_json('não é json') == 'não é json'
+    assert raw_json(None) == ''
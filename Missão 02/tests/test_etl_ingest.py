@@ -0,0 +1,110 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+from sqlalchemy.exc import DataError, OperationalError
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'template', 'backend'))
+import etl_ingest
+from etl.dead_letter import DeadLetterSink
+
+class FakeLoader:
+    """Recusa (como o COPY) qualquer lote com uma linha marcada"""
+
+    def __init__(self, error):
+        self.error = error
+        self.loaded = []
+
+    def load_batch(self, batch):
+        if any(p['bad'] for p in batch):
+            raise self.error
+        self.loaded += [p['line_no'] for p in batch]
+        return len(batch)
+
+def _batch(bad_lines, size=10):
+    return [{'line_no': n, 'raw': '{}', 'bad': n in bad_lines} for n in range(1, size + 1)]
+
+def _sink(tmp_path):
+    return DeadLetterSink('input.ndjson', path=str(tmp_path / 'dead.ndjson'))
+
+def test_data_error_dead_letters_only_the_offending_rows(tmp_path):
+    loader = FakeLoader(DataError('COPY', {}, Exception('value too long')))
+    dead_letter = _sink(tmp_path)
+    loaded = etl_ingest.flush_batch(loader, _batch({3, 8}), dead_letter)
+    assert [p['line_no'] for p in loaded] == [1, 2, 4, 5, 6, 7, 9, 10]
+    assert sorted(loader.loaded) == [1, 2, 4, 5, 6, 7, 9, 10]
+    assert dead_letter.count == 2
+
+def test_database_failure_is_raised_without_dead_lettering(tmp_path):
+    loader = FakeLoader(OperationalError('COPY', {}, Exception('connection refused')))
+    dead_letter = _sink(tmp_path)
+    with pytest.raises(OperationalError):
+        etl_ingest.flush_batch(loader, _batch({3}), dead_letter)
+    assert dead_letter.count == 0
+
+# Valores possíveis de cada campo: os dois primeiros passam pelo caminho rápido;
+# depois, bordas, valores com coerção do pydantic e inválidos
+FIELD_VALUES = {
+    'id': ['S1', 'S2', None, 42],
+    'effectiveDateTime': ['2024-05-01T10:30:00Z', '2024-05-01 10:30', '2024-05-01T10:30:00.123+03:00',
+                          '2024-05-01T10:30:00-0300', '2024-13-01T10:30:00Z', '2024-02-30T00:00:00',
+                          '2024-05-01', 1714559400, None, 'ontem'],
+    'age': [0, 30, 130, 131, -1, 30.0, '45', None, True],
+    'sex': ['M', 'f', 'u', 'X', '', None, 1],
+    'hb': [2.0, 13.5, 25.0, 25.01, 1.9, '12.5', 'n/d', None, 12],
+    'platelets': [1000, 250000, 5000000, 999, 5000001, 250000.0, '250000', None],
+    'wbc': [7.0, 3, '6.5', 'x', None],
+    'municipality_code': ['5300108', None, 5300108],
+}
+
+def _line(rng):
+    rec = {field: rng.choice(values[:2] if rng.random() < 0.9 else values)
+           for field, values in FIELD_VALUES.items()}
+    rec['subject'] = {'reference': rng.choice(['Patient/1', None])}
+    return json.dumps(rec)
+
+def _by_line(lines, first_line=1):
+    """Resultado linha a linha no formato de parse_block: (payloads, erros)"""
+    payloads, errors = [], []
+    for line_no, line in enumerate(lines, start=first_line):
+        payload, error = etl_ingest.parse_line(line_no, line)
+        if payload:
+            payloads.append(payload)
+        if error:
+            errors.append(error)
+    return payloads, errors
+
+def _without_raw(payloads):
+    # parse_line reserializa o registro; parse_block guarda o texto original
+    return [{k: v for k, v in p.items() if k != 'raw'} for p in payloads]
+
+def test_parse_block_matches_parse_line_on_edge_cases():
+    lines = [
+        '{"id": "S1", "effectiveDateTime": "2024-05-01T10:30:00Z", "hb": 13.5}\n',
+        '{"id": "S2", "effectiveDateTime": "2024-13-01T10:30:00Z"}\n',
+        '{"id": "S3", "effectiveDateTime": "2024-05-01T10:30:00Z", "hb": NaN}\n',
+        '{"id": "S4", "effectiveDateTime": "2024-05-01T10:30:00Z", "age": 30.0, "sex": "m"}\n',
+        'não é json\n',
+        '[1, 2]\n',
+        '{"id": "S5", "effectiveDateTime": "2024-05-01T10:30:00Z", "platelets": 999}\n',
+    ]
+    block_payloads, block_errors = etl_ingest.parse_block(1, lines)
+    line_payloads, line_errors = _by_line(lines)
+    assert [p['line_no'] for p in block_payloads] == [1, 4]
+    assert _without_raw(block_payloads) == _without_raw(line_payloads)
+    assert block_errors == line_errors
+    assert block_payloads[0]['raw'] == lines[0].rstrip('\n')
+
+@pytest.mark.parametrize('seed', range(5))
+def test_parse_block_matches_parse_line_on_random_records(seed):
+    rng = random.Random(seed)
+    lines = [_line(rng) + '\n' for _ in range(300)]
+    block_payloads, block_errors = etl_ingest.parse_block(11, lines)
+    line_payloads, line_errors = _by_line(lines, first_line=11)
+    assert block_payloads and block_errors
+    assert _without_raw(block_payloads) == _without_raw(line_payloads)
+    assert block_errors == line_errors
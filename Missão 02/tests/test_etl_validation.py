@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from etl.etl import CONVERSION_ERROR, DataProcessor
+
+def _frame():
+    return pd.DataFrame([
+        {'sample_id': 'S00001', 'municipality_code': '5300108', 'hemoglobin': 13.5,
+         'platelets': 250000, 'leukocytes': 7.0, 'neutrophils': '4.1'},
+        {'sample_id': 'S00002', 'municipality_code': '5300108', 'hemoglobin': 12.0,
+         'platelets': 240000, 'leukocytes': 6.5, 'neutrophils': 'n/d'},
+    ], dtype=object)
+
+def test_conversion_failure_has_same_reason_on_both_paths():
+    reports = []
+    for vectorized in (True, False):
+        processor = DataProcessor(vectorized=vectorized, debug_rows=False)
+        out = processor.process_dataframe(_frame())
+        assert list(out['sample_id']) == ['S00001']
+        assert processor.stats['errors'] == 1
+        reports.append(processor.report)
+    columnar, rows = reports
+    assert dict(columnar.reasons) == dict(rows.reasons) == {CONVERSION_ERROR: 1}
+    assert dict(columnar.columns) == dict(rows.columns) == {'neutrophils': 1}
+
+def test_malformed_exam_date_rejects_only_that_row():
+    df = pd.DataFrame([
+        {'sample_id': 'S00001', 'municipality_code': '5300108', 'hemoglobin': 13.5,
+         'exam_date': '2024-05-01'},
+        {'sample_id': 'S00002', 'municipality_code': '5300108', 'hemoglobin': 12.0,
+         'exam_date': '2024-13-45'},
+        {'sample_id': 'S00003', 'municipality_code': '5300108', 'hemoglobin': 12.5,
+         'exam_date': None},
+        {'sample_id': 'S00004', 'municipality_code': '5300108', 'hemoglobin': 11.0,
+         'exam_date': '2024-05-02T10:30:00Z'},
+    ], dtype=object)
+    for vectorized in (True, False):
+        processor = DataProcessor(vectorized=vectorized, debug_rows=False)
+        out = processor.process_dataframe(df)
+        assert list(out['sample_id']) == ['S00001', 'S00003', 'S00004']
+        assert list(out['exam_date'].where(out['exam_date'].notna(), None)) == [
+            '2024-05-01', None, '2024-05-02']
+        assert dict(processor.report.reasons) == {'exam_date inválida': 1}
+        assert dict(processor.report.columns) == {'exam_date': 1}
+
+@pytest.mark.parametrize('column, good, bad, reason', [
+    ('birth_date', '1980-02-29', '29/02/1980', "birth_date inválida"),
+    ('birth_date', '1980-02-28', '1981-02-29', "birth_date inválida"),
+    ('sex', 'F', 'Feminino', "sex inválido"),
+    ('patient_age', 42, 130, "idade fora da faixa aceitável"),
+    ('lymphocytes', '2.5', 10000, "linfócitos fora da faixa aceitável"),
+    ('neutrophils', 9999.99, '12345.6', "neutrófilos fora da faixa aceitável"),
+    ('lab_id', 'L' * 50, 'L' * 51, "lab_id inválido"),
+    ('sample_id', 'S' * 100, 'S' * 101, "sample_id inválido"),
+])
+def test_value_over_column_limit_rejects_only_that_row(column, good, bad, reason):
+    rows = [
+        {'sample_id': 'S00001', 'municipality_code': '5300108', 'hemoglobin': 13.5},
+        {'sample_id': 'S00002', 'municipality_code': '5300108', 'hemoglobin': 12.0},
+        {'sample_id': 'S00003', 'municipality_code': '5300108', 'hemoglobin': 12.5},
+    ]
+    rows[0][column], rows[1][column], rows[2][column] = good, bad, None
+    if column == 'sample_id':
+        rows[2][column] = 'S00003'
+    df = pd.DataFrame(rows, dtype=object)
+    for vectorized in (True, False):
+        processor = DataProcessor(vectorized=vectorized, debug_rows=False)
+        out = processor.process_dataframe(df)
+        assert list(out['sample_id']) == [rows[0]['sample_id'], rows[2]['sample_id']]
+        assert dict(processor.report.reasons) == {reason: 1}
+        assert dict(processor.report.columns) == {column: 1}
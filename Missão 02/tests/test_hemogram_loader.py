@@ -0,0 +1,60 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import etl.etl as etl_module
+from etl.etl import HemogramLoader
+
+MUNICIPALITY = '9999991'
+FIRST_DAY = date(2024, 1, 15)
+
+class FirstDay(date):
+    @classmethod
+    def today(cls):
+        return FIRST_DAY
+
+def _sample(hemoglobin, exam_date=None):
+    return pd.DataFrame([{
+        'sample_id': 'TEST-RELOAD-1', 'municipality_code': MUNICIPALITY, 'hemoglobin': hemoglobin,
+        'platelets': 250000, 'leukocytes': 7.0, 'lymphocytes': None, 'neutrophils': None,
+        'exam_date': exam_date, 'patient_age': 40, 'patient_hash': None, 'lab_id': None,
+        'is_valid': True, 'validation_notes': None,
+    }])
+
+def _stored(db_engine):
+    with db_engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT exam_date, hemoglobin FROM hemogram WHERE sample_id = 'TEST-RELOAD-1'
+        """)).fetchall()
+        rollup = conn.execute(text("""
+            SELECT day, sum(exam_count) AS exams, sum(hemoglobin_sum) AS hemoglobin
+            FROM hemogram_daily_rollup WHERE municipality_code = :m GROUP BY day
+        """), {'m': MUNICIPALITY}).fetchall()
+    return [(r.exam_date, float(r.hemoglobin)) for r in rows], {r.day: (r.exams, float(r.hemoglobin)) for r in rollup}
+
+@pytest.fixture
+def loader(db_engine, test_samples):
+    yield HemogramLoader(db_engine)
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM hemogram_daily_rollup WHERE municipality_code = :m"),
+                     {'m': MUNICIPALITY})
+
+def test_undated_sample_reloaded_on_another_day_updates_the_same_row(db_engine, loader, monkeypatch):
+    monkeypatch.setattr(etl_module, 'date', FirstDay)
+    loader.load(_sample(12.0))
+    monkeypatch.undo()
+    loader.load(_sample(11.0))
+    
+    rows, rollup = _stored(db_engine)
+    assert rows == [(FIRST_DAY, 11.0)]
+    assert rollup == {FIRST_DAY: (1, 11.0)}
+
+def test_corrected_exam_date_keeps_a_single_row(db_engine, loader):
+    loader.load(_sample(12.0, '2024-01-15'))
+    loader.load(_sample(10.5, '2024-02-03'))
+    
+    rows, rollup = _stored(db_engine)
+    assert rows == [(FIRST_DAY, 10.5)]
+    assert rollup == {FIRST_DAY: (1, 10.5)}
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+# Módulos que CLIs e a API importam antes de saber se vão processar algo
+CHECK = """
+import sys
+import {module}
+loaded = [name for name in ('numpy', 'pandas', 'pydantic', 'sqlalchemy')
+          if name in sys.modules and type(sys.modules[name]).__name__ == 'module']
+print(','.join(loaded))
+"""
+
+@pytest.mark.parametrize('module, directory', [
+    ('alerts_engine.alerts_engine', ROOT), ('alerts_engine.writer', ROOT),
+    ('etl.dead_letter', ROOT), ('etl.etl', ROOT),
+    ('etl_ingest', os.path.join(ROOT, 'template', 'backend')),
+])
+def test_import_does_not_load_heavy_dependencies(module, directory, tmp_path):
+    # Processo novo: outros testes já importaram tudo neste. O etl_ingest
+    # configura o log em etl.log no diretório atual, por isso o tmp_path.
+    env = {**os.environ, 'PYTHONPATH': directory}
+    out = subprocess.run([sys.executable, '-c', CHECK.format(module=module)], cwd=tmp_path, env=env,
+                         capture_output=True, text=True, check=True).stdout.strip()
+    assert out == ''
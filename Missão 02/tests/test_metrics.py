@@ -0,0 +1,42 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from alerts_engine.alerts_engine import MetricsCalculator
+from alerts_engine.rollup import refresh_daily_rollup
+
+MUNICIPALITY = '9999990'
+
+@pytest.fixture
+def exams_by_age(db_engine, test_samples):
+    ages = (17, 18, 19, 20, 39, 40, 41, 44, 45)
+    with db_engine.begin() as conn:
+        for age in ages:
+            conn.execute(text("""
+                INSERT INTO hemogram (sample_id, municipality_code, hemoglobin, exam_date, patient_age)
+                VALUES (:sample_id, :municipality_code, 9.0, current_date, :age)
+            """), {'sample_id': f"TEST-AGE-{age}", 'municipality_code': MUNICIPALITY, 'age': age})
+        refresh_daily_rollup(conn, [(date.today(), MUNICIPALITY)])
+    yield ages
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM hemogram_daily_rollup WHERE municipality_code = :m"),
+                     {'m': MUNICIPALITY})
+
+def test_age_filter_is_exact_on_and_off_band_edges(db_engine, exams_by_age):
+    metrics = MetricsCalculator(db_engine)
+    for age_range in ((18, 40), (20, 44), (None, 19), (41, None)):
+        low = age_range[0] if age_range[0] is not None else 0
+        high = age_range[1] if age_range[1] is not None else 200
+        expected = sum(1 for age in exams_by_age if low <= age <= high)
+        result = metrics.get_basic_metrics(age_range, MUNICIPALITY, days_back=30)
+        assert result['total_exams'] == expected, age_range
+        assert result['anemia_moderate_percent'] == 100.0
+
+def test_any_integer_age_range_is_served_by_the_rollup(db_engine, exams_by_age):
+    metrics = MetricsCalculator(db_engine)
+    # Sem hemogram no caminho: apagar as linhas de origem não muda a resposta
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM hemogram WHERE municipality_code = :m"), {'m': MUNICIPALITY})
+    assert metrics.get_basic_metrics((18, 40), MUNICIPALITY)['total_exams'] == 5
+    assert metrics.get_basic_metrics((19, 19), MUNICIPALITY)['total_exams'] == 1
@@ -0,0 +1,77 @@
+from alerts_engine.cache import ResultCache
+
+def test_make_key_ignores_order_empty_values_and_whitespace():
+    key = ResultCache.make_key('metrics', municipality_code=' 5300108 ', age_range=None, days_back=30)
+    assert key == ResultCache.make_key('metrics', days_back=30, municipality_code='5300108')
+    assert ResultCache.make_key('metrics', age_range=(None, '')) == ResultCache.make_key('metrics')
+    assert ResultCache.make_key('metrics', age_range=(18, None)) != ResultCache.make_key('metrics')
+
+def test_entry_expires_after_ttl():
+    cache = ResultCache(ttl=0)
+    cache.put('k', {'total': 1})
+    assert cache.get('k') is None
+    assert len(cache) == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(ttl=60, maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a').value == 1  # consulta renova 'a'
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a').value == 1 and cache.get('c').value == 3
+
+def test_get_or_compute_counts_hits_and_skips_uncacheable_results():
+    cache = ResultCache(ttl=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {}
+
+    cache.get_or_compute('k', compute, cacheable=bool)
+    cache.get_or_compute('k', compute, cacheable=bool)
+    assert len(calls) == 2 and len(cache) == 0
+    cache.get_or_compute('j', lambda: {'total': 1})
+    assert cache.get_or_compute('j', compute).value == {'total': 1}
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def test_result_computed_before_invalidation_is_not_stored():
+    cache = ResultCache(ttl=60)
+
+    def compute():
+        cache.invalidate()  # carga terminou durante o cálculo
+        return {'total': 1}
+
+    assert cache.get_or_compute('k', compute).value == {'total': 1}
+    assert cache.get('k') is None
+
+def test_etag_depends_only_on_the_value():
+    cache = ResultCache(ttl=60)
+    first = cache.put('a', {'x': 1, 'y': [1, 2]})
+    assert cache.put('b', {'y': [1, 2], 'x': 1}).etag == first.etag
+    assert cache.put('c', {'x': 2, 'y': [1, 2]}).etag != first.etag
+
+def test_changed_data_version_invalidates_entries():
+    version = [1]
+    cache = ResultCache(ttl=60, version=lambda: version[0], version_interval=0)
+    cache.get_or_compute('k', lambda: {'total': 1})
+    assert cache.get_or_compute('k', lambda: {'total': 2}).value == {'total': 1}
+    version[0] = 2  # carga feita por outro processo
+    assert cache.get_or_compute('k', lambda: {'total': 2}).value == {'total': 2}
+
+def test_data_version_is_read_at_most_once_per_interval():
+    calls = []
+    cache = ResultCache(ttl=60, version=lambda: calls.append(1) or len(calls), version_interval=60)
+    for _ in range(3):
+        cache.get_or_compute('k', lambda: {'total': 1})
+    assert len(calls) == 1
+    assert cache.hits == 2
+
+def test_failing_data_version_keeps_serving_entries():
+    def version():
+        raise RuntimeError('banco indisponível')
+
+    cache = ResultCache(ttl=60, version=version, version_interval=0)
+    cache.put('k', {'total': 1})
+    assert cache.get_or_compute('k', lambda: {'total': 2}).value == {'total': 1}
@@ -0,0 +1,73 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from alerts_engine.rules import DEFAULT_RULES, AlertRule, RuleSet
+
+# Valores nas bordas de cada regra, mais nulos e texto não numérico
+VALUES = {
+    'platelets': [None, 0, 49999, 50000, 99999.5, 100000, 250000],
+    'hemoglobin': [None, 7.99, 8, 9.99, 10, 13.5, 'n/d'],
+    'leukocytes': [None, 1.99, 2.0, 2.01, 7.0, 0, 'x'],
+}
+
+def _frame(seed=7, size=200):
+    rng = np.random.default_rng(seed)
+    rows = [{field: values[(i + j) % len(values)] for j, (field, values) in enumerate(VALUES.items())}
+            for i in range(max(map(len, VALUES.values())) ** 2)]
+    for _ in range(size):
+        rows.append({'platelets': float(rng.integers(0, 200000)),
+                     'hemoglobin': round(float(rng.uniform(5, 15)), 2),
+                     'leukocytes': round(float(rng.uniform(0, 5)), 2)})
+    return pd.DataFrame(rows, dtype=object)
+
+def _sql_positions(frame, clause, params):
+    """Posições que o predicado SQL seleciona, num SQLite em memória"""
+    conn = sqlite3.connect(':memory:')
+    names = list(frame.columns)
+    conn.execute(f"CREATE TABLE hemogram (pos INTEGER, {', '.join(f'{n} REAL' for n in names)})")
+    numeric = frame.apply(pd.to_numeric, errors='coerce')
+    rows = [(pos, *(None if pd.isna(v) else float(v) for v in row))
+            for pos, row in enumerate(numeric.itertuples(index=False))]
+    conn.executemany(f"INSERT INTO hemogram VALUES ({', '.join('?' * (len(names) + 1))})", rows)
+    found = {pos for (pos,) in conn.execute(f"SELECT pos FROM hemogram WHERE {clause}", params)}
+    conn.close()
+    return found
+
+@pytest.mark.parametrize('columns', [None, {'leukocytes': 'wbc'}])
+def test_where_clause_selects_the_same_rows_as_the_masks(columns):
+    frame = _frame()
+    if columns:
+        frame = frame.rename(columns=columns)
+    rules = RuleSet(DEFAULT_RULES, columns)
+    clause, params = rules.where_clause()
+    # O template guarda leucócitos em wbc: SQL e máscara devem usar a mesma coluna
+    expected = set()
+    for _, positions, _ in rules.evaluate(frame):
+        expected.update(int(p) for p in positions)
+    assert expected
+    assert _sql_positions(frame, clause, params) == expected
+
+@pytest.mark.parametrize('rule', DEFAULT_RULES, ids=lambda rule: rule.condition)
+def test_each_rule_predicate_matches_its_mask(rule):
+    frame = _frame(seed=11)
+    clause, params = rule.to_sql('p')
+    values = pd.to_numeric(frame[rule.field], errors='coerce').to_numpy(dtype=float)
+    expected = {int(p) for p in np.flatnonzero(rule.mask(values))}
+    assert _sql_positions(frame, clause, params) == expected
+
+def test_between_is_inclusive_below_and_exclusive_above():
+    rule = AlertRule('c', 'platelets', 'between', (50000, 100000), 2, 'm')
+    assert rule.mask(np.array([49999.0, 50000.0, 99999.0, 100000.0, np.nan])).tolist() == \
+        [False, True, True, False, False]
+
+def test_empty_rule_set_selects_nothing():
+    clause, params = RuleSet([]).where_clause()
+    assert _sql_positions(_frame(size=0), clause, params) == set()
+    assert list(RuleSet([]).evaluate(_frame(size=0))) == []
+
+def test_unknown_operator_is_rejected():
+    with pytest.raises(ValueError):
+        AlertRule('c', 'platelets', '!=', 1, 1, 'm')
@@ -0,0 +1,28 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from alerts_engine.alerts_engine import AlertEngine
+from alerts_engine.trends import PatientWindowIndex
+
+TrendRow = namedtuple('TrendRow', 'id sample_id patient_hash municipality_code hemoglobin platelets ts')
+
+def _rows():
+    start = datetime(2024, 5, 1, 8)
+    return [
+        TrendRow(1, 'TEST-T1', 'p1', '5300108', 12.0, 250000, start),
+        TrendRow(2, 'TEST-T2', 'p1', '5300108', 9.0, 240000, start + timedelta(hours=24)),
+    ]
+
+def _engine():
+    # Sem banco: só as regras temporais e o writer em memória
+    return AlertEngine(db_engine=None)
+
+def test_explicit_empty_index_is_used_instead_of_shared_one():
+    engine = _engine()
+    index = PatientWindowIndex(engine.patient_index.window, engine.patient_index.fields)
+    assert len(index) == 0
+    engine._evaluate_trends(_rows(), index)
+    assert len(engine.patient_index) == 0
+    assert engine.patient_index.latest is None
+    assert len(index) == 1
+    assert [a['condition'] for a in engine.writer._pending] == ['hb_drop_15pct_72h']
@@ -0,0 +1,58 @@
+from etl.validation_report import ValidationReport
+
+def test_reservoir_never_exceeds_sample_size_and_counts_are_exact():
+    report = ValidationReport(sample_size=3, seed=1)
+    for i in range(50):
+        report.record([('hb fora da faixa', 'hemoglobin'), ('sem municipio', None)], example={'line': i})
+    report.record_column('hb fora da faixa', 'hemoglobin', 200, example=lambda i: {'block': i})
+    report.add_rejected(200)
+    assert report.rejected == 250
+    assert report.reasons == {'hb fora da faixa': 250, 'sem municipio': 50}
+    assert report.columns == {'hemoglobin': 250}
+    assert len(report.samples['hb fora da faixa']) == 3
+    assert len(report.samples['sem municipio']) == 3
+
+def test_examples_are_built_only_for_chosen_rows():
+    report = ValidationReport(sample_size=5, seed=2)
+    built = []
+
+    def example(i):
+        built.append(i)
+        return i
+
+    report.record_column('motivo', 'platelets', 10000, example=example)
+    # Algoritmo R: ~k·ln(n/k) substituições, muito menos que n
+    assert 5 <= len(built) < 100
+    assert built[:5] == [0, 1, 2, 3, 4]
+    assert len(report.samples['motivo']) == 5
+
+def test_reservoir_is_uniform_over_all_occurrences():
+    early = 0
+    for seed in range(400):
+        report = ValidationReport(sample_size=5, seed=seed)
+        for start in range(0, 1000, 100):
+            report.record_column('motivo', None, 100, example=lambda i, start=start: start + i)
+        early += sum(1 for line in report.samples['motivo'] if line < 500)
+    assert 0.45 < early / (400 * 5) < 0.55
+
+def test_merge_keeps_the_limit_and_adds_counts():
+    total = ValidationReport(source='arquivo', sample_size=4, seed=3)
+    for block in range(3):
+        part = ValidationReport(sample_size=4, seed=block)
+        part.observe(100)
+        part.record_column('motivo', 'wbc', 30, example=lambda i, block=block: (block, i))
+        part.add_rejected(30)
+        total.merge(part)
+    summary = total.summary()
+    assert summary['rows'] == 300 and summary['rejected'] == 90
+    assert summary['rejected_pct'] == 30.0
+    assert summary['by_reason'] == {'motivo': 90}
+    assert summary['by_column'] == {'wbc': 90}
+    assert len(summary['samples']['motivo']) == 4
+
+def test_sample_size_zero_keeps_only_counts():
+    report = ValidationReport(sample_size=0)
+    report.record([('motivo', 'sex')], example={'line': 1})
+    report.record_column('motivo', 'sex', 5, example=lambda i: i)
+    assert report.reasons == {'motivo': 6}
+    assert report.samples == {}